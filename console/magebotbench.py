@@ -0,0 +1,207 @@
+# MageBot Bench - Decision latency and nodes/sec benchmark for the AI
+# Notes: Times every search engine at depths 1-6 on a fixed corpus of duel positions, reports nodes
+# visited, nodes/sec and p50/p99 decision latency as JSON, checks that the faster engines pick the same
+# move as the reference minimax at the same depth, and compares two runs to catch regressions.
+# Every decision starts from an empty transposition table so runs are comparable. Nodes are counted
+# on an untimed warm-up decision, so the timed ones run without instrumentation.
+#
+# Usage: python console/magebotbench.py run --output bench.json
+#        python console/magebotbench.py compare base.json bench.json --threshold 0.10
+
+# Import necessary modules
+import argparse
+import json
+import platform
+import sys
+import time
+
+import magebotcli
+from magebotcli import (
+    DuelState, MAGEBOT, MctsTree, SearchStats, TranspositionTable, batch_minimax_search, expectimax_search,
+    iterative_deepening_search, magebot_choose_spell, mcts_search,
+)
+from magebotserver import percentile
+
+# Fixed corpus: MageBot to move, burn tick already applied. Fields: player hp, res, mana, frozen,
+# paralyzed, burned, then the same for MageBot.
+CORPUS = {
+    "opening": (10, 5, 15, 0, 0, 0, 10, 5, 15, 0, 0, 0),
+    "opening_res_broken": (10, 5, 14, 0, 0, 0, 9, 0, 15, 0, 0, 0),
+    "midgame": (12, 2, 11, 0, 0, 0, 9, 0, 13, 0, 0, 0),
+    "midgame_effects": (11, 0, 12, 0, 1, 0, 10, 3, 10, 0, 0, 1),
+    "low_mana": (14, 0, 3, 0, 0, 0, 13, 1, 2, 0, 0, 0),
+    "low_mana_both": (6, 0, 1, 0, 0, 0, 7, 0, 1, 0, 0, 0),
+    "near_death_magebot": (15, 3, 12, 0, 0, 0, 2, 0, 10, 0, 0, 0),
+    "near_death_player": (2, 0, 6, 0, 0, 0, 11, 2, 9, 0, 0, 0),
+    "near_death_both": (3, 0, 5, 0, 0, 1, 3, 1, 5, 0, 0, 0),
+}
+
+REFERENCE = "minimax-reference"
+# Engine -> function(state, depth) returning a spell name. MCTS has no depth: "depth" d runs
+# MCTS_BENCH_ITERATIONS * d iterations, on a fresh tree and a fixed seed.
+MCTS_BENCH_ITERATIONS = 500
+ENGINES = {
+    REFERENCE: lambda state, depth: magebot_choose_spell(state, table=None, depth=depth),
+    "minimax": lambda state, depth: magebot_choose_spell(state, table=TranspositionTable(), depth=depth),
+    "batch": lambda state, depth: batch_minimax_search(state, depth=depth)[0],
+    "alphabeta": lambda state, depth: iterative_deepening_search(state, time_budget=None, max_depth=depth, table=TranspositionTable())[0],
+    "expectimax": lambda state, depth: expectimax_search(state, depth=depth, node_budget=None, table=TranspositionTable())[0],
+    "mcts": lambda state, depth: mcts_search(state, iterations=MCTS_BENCH_ITERATIONS * depth, workers=1, tree=MctsTree(), seed=0)[0],
+}
+# Engines that must agree with the reference (expectimax plans against another game: effect procs)
+EXACT_ENGINES = ("minimax", "batch", "alphabeta")
+# Deepest default depth per engine, so a default run stays in the minutes (full-width depth 6 takes ~30 s per position)
+DEFAULT_MAX_DEPTH = {REFERENCE: 4, "minimax": 5, "batch": 6, "alphabeta": 6, "expectimax": 5, "mcts": 6}
+# Latency changes smaller than this are timer noise, whatever the threshold
+MIN_DELTA_MS = 1.0
+
+
+def corpus_state(fields):
+    return DuelState(*fields, MAGEBOT)
+
+# Times `engine` at `depth` over the corpus, `repeats` decisions per position
+def bench_engine(engine, depth, repeats=3):
+    choose = ENGINES[engine]
+    latencies = []
+    nodes = 0
+    moves = {}
+    for position, fields in CORPUS.items():
+        state = corpus_state(fields)
+        # Warm-up, untimed, with the node counters on
+        magebotcli.search_stats = SearchStats()
+        try:
+            moves[position] = choose(state, depth)
+            nodes += magebotcli.search_stats.total_nodes()
+        finally:
+            magebotcli.search_stats = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            choose(state, depth)
+            latencies.append(time.perf_counter() - started)
+    elapsed = sum(latencies)
+    return {
+        "engine": engine,
+        "depth": depth,
+        "decisions": len(latencies),
+        "nodes": nodes,
+        "nodes_per_s": nodes * repeats / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "moves": moves,
+    }
+
+def run_benchmark(engines=None, depths=range(1, 7), repeats=3, max_depth=None, verbose=True):
+    engines = list(ENGINES) if engines is None else engines
+    if magebotcli.np is None and "batch" in engines:
+        print("[Bench] numpy is not installed, skipping the batch engine", file=sys.stderr)
+        engines = [engine for engine in engines if engine != "batch"]
+    max_depth = dict(DEFAULT_MAX_DEPTH, **(max_depth or {}))
+    results = {}
+    for engine in engines:
+        for depth in depths:
+            if depth > max_depth.get(engine, depth):
+                continue
+            result = bench_engine(engine, depth, repeats)
+            results[f"{engine}/d{depth}"] = result
+            if verbose:
+                print(f"[Bench] {engine:18} d{depth}: {result['nodes']:>9} nodes | {result['nodes_per_s']:>9.0f} nodes/s | "
+                      f"p50 {result['p50_ms']:8.2f} ms | p99 {result['p99_ms']:8.2f} ms", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeats": repeats,
+            "corpus": sorted(CORPUS),
+        },
+        "results": results,
+        "mismatches": check_moves(results),
+    }
+
+# Positions where an exact engine does not play the reference move at the same depth
+def check_moves(results):
+    mismatches = []
+    for key, result in results.items():
+        if result["engine"] not in EXACT_ENGINES:
+            continue
+        reference = results.get(f"{REFERENCE}/d{result['depth']}")
+        if reference is None:
+            continue
+        for position, move in result["moves"].items():
+            if move != reference["moves"][position]:
+                mismatches.append({"engine": result["engine"], "depth": result["depth"], "position": position,
+                                   "move": move, "reference": reference["moves"][position]})
+    return mismatches
+
+# Regressions of `new` against `base`: latency up or nodes/sec down by more than `threshold`,
+# node count up and move changes at the same depth
+def compare_runs(base, new, threshold=0.10, min_delta_ms=MIN_DELTA_MS):
+    regressions = []
+    for key, result in new["results"].items():
+        before = base["results"].get(key)
+        if before is None:
+            continue
+        for stat in ("p50_ms", "p99_ms"):
+            if result[stat] > before[stat] * (1 + threshold) and result[stat] - before[stat] >= min_delta_ms:
+                regressions.append(f"{key}: {stat[:3]} {before[stat]:.2f} ms -> {result[stat]:.2f} ms")
+        # Only meaningful when the search takes long enough to time
+        if before["p50_ms"] >= min_delta_ms and result["nodes_per_s"] < before["nodes_per_s"] * (1 - threshold):
+            regressions.append(f"{key}: {before['nodes_per_s']:.0f} -> {result['nodes_per_s']:.0f} nodes/s")
+        if result["nodes"] > before["nodes"] * (1 + threshold):
+            regressions.append(f"{key}: {before['nodes']} -> {result['nodes']} nodes")
+        for position, move in result["moves"].items():
+            if before["moves"].get(position, move) != move:
+                regressions.append(f"{key}: {position} plays {move} instead of {before['moves'][position]}")
+    for mismatch in new["mismatches"]:
+        regressions.append(f"{mismatch['engine']}/d{mismatch['depth']}: {mismatch['position']} plays {mismatch['move']}, "
+                           f"reference minimax plays {mismatch['reference']}")
+    return regressions
+
+def _parse_depths(text):
+    if "-" in text:
+        first, last = text.split("-", 1)
+        return range(int(first), int(last) + 1)
+    return [int(depth) for depth in text.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MageBot AI benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="benchmark the engines and write the results as JSON")
+    run.add_argument("--output", help="JSON file (default: stdout)")
+    run.add_argument("--engines", default=",".join(ENGINES))
+    run.add_argument("--depths", default="1-6", help="e.g. 1-6 or 2,4")
+    run.add_argument("--repeats", type=int, default=3)
+    run.add_argument("--full", action="store_true", help="run every engine at every depth (slow)")
+    compare = subparsers.add_parser("compare", help="compare two runs, exit 1 on regressions")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10)
+    compare.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        max_depth = {engine: 99 for engine in ENGINES} if args.full else None
+        report = run_benchmark(args.engines.split(","), _parse_depths(args.depths), args.repeats, max_depth)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        for mismatch in report["mismatches"]:
+            print(f"[Bench] MISMATCH {mismatch}", file=sys.stderr)
+        return 1 if report["mismatches"] else 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions = compare_runs(base, new, args.threshold, args.min_delta_ms)
+    for regression in regressions:
+        print(f"[Bench] REGRESSION {regression}")
+    if not regressions:
+        print("[Bench] No regression.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
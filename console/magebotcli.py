@@ -2,9 +2,29 @@
 # Notes: When a duel starts, the system activates MageBot AI since CLI mode is against AI.
 
 # Import necessary modules
+import argparse
 import asyncio
+import bisect
+import cProfile
+import hashlib
+import json
+import math
+import mmap
+import os
+import pstats
 import random
+import struct
+import sys
+import time
+from collections import Counter, OrderedDict, namedtuple
+from enum import IntEnum
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
 from colorama import Fore, Style, init as colorama_init
+try:
+    import numpy as np
+except ImportError:  # optional: only the "batch" engine (and the tablebase builder) need it
+    np = None
 
 # Initialize Colorama for colored text in the terminal
 colorama_init(autoreset=True)
@@ -12,333 +32,1921 @@ colorama_init(autoreset=True)
 # Valeurs globales (utilisées par l'heuristique)
 MAX_HP = 20
 MAX_MANA = 25
+MANA_REGEN = 2   # mana recovered at the end of each turn
+BURN_DAMAGE = 1  # damage taken at the start of each burned turn
 
 
 # ---- Gestion des fonctions du jeu ----
 
-# Utility functions for readable duel display
-def print_duel_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, player_effects=None, magebot_effects=None):
-    print(f"\n{Fore.YELLOW}--- Duel State ---{Style.RESET_ALL}")
+# Utility functions for readable duel display (format_* return the text, print_* print it)
+def format_duel_state(state):
+    lines = [f"\n{Fore.YELLOW}--- Duel State ---{Style.RESET_ALL}"]
     effects_str = ""
-    if player_effects:
-        active_effects = [k for k, v in player_effects.items() if v > 0]
-        if active_effects:
-            effects_str += f" | Effects: {', '.join(active_effects)}"
-    print(f"{Fore.GREEN}You      : {player_hp} HP | Resistance : {player_res} | Mana : {player_mana}{effects_str}{Style.RESET_ALL}")
+    active_effects = active_effect_names(state, PLAYER)
+    if active_effects:
+        effects_str += f" | Effects: {', '.join(active_effects)}"
+    lines.append(f"{Fore.GREEN}You      : {state.player_hp} HP | Resistance : {state.player_res} | Mana : {state.player_mana}{effects_str}{Style.RESET_ALL}")
     effects_str = ""
     # Display MageBot effects
-    if magebot_effects:
-        active_effects = [k for k, v in magebot_effects.items() if v > 0]
-        if active_effects:
-            effects_str += f" | Effects: {', '.join(active_effects)}"
-    print(f"{Fore.MAGENTA}MageBot  : {magebot_hp} HP | Resistance : {magebot_res} | Mana : {magebot_mana}{effects_str}{Style.RESET_ALL}")
-    print(f"{Fore.YELLOW}---------------------{Style.RESET_ALL}\n")
+    active_effects = active_effect_names(state, MAGEBOT)
+    if active_effects:
+        effects_str += f" | Effects: {', '.join(active_effects)}"
+    lines.append(f"{Fore.MAGENTA}MageBot  : {state.magebot_hp} HP | Resistance : {state.magebot_res} | Mana : {state.magebot_mana}{effects_str}{Style.RESET_ALL}")
+    lines.append(f"{Fore.YELLOW}---------------------{Style.RESET_ALL}\n")
+    return "\n".join(lines)
+
 # Log actions during the duel
-def print_action_log(actor, spell_name, spell, effect_value, target):
+def format_action_log(actor, spell_name, spell, effect_value, target):
     if "damage" in spell:
         ascii = f"{Fore.RED}>>>>>" if actor == "You" else f"{Fore.MAGENTA}<<<<<"
-        print(f"{ascii} {actor} casts {spell_name} (Attack) : {Fore.RED}{effect_value} magical damage dealt to {target} !{Style.RESET_ALL}")
+        return f"{ascii} {actor} casts {spell_name} (Attack) : {Fore.RED}{effect_value} magical damage dealt to {target} !{Style.RESET_ALL}"
     elif "healing" in spell:
         ascii = f"{Fore.GREEN}+++++"
-        print(f"{ascii} {actor} casts {spell_name} (Healing) : {Fore.GREEN}{effect_value} HP restored.{Style.RESET_ALL}")
+        return f"{ascii} {actor} casts {spell_name} (Healing) : {Fore.GREEN}{effect_value} HP restored.{Style.RESET_ALL}"
     elif "resistance_boost" in spell:
         ascii = f"{Fore.CYAN}====="
-        print(f"{ascii} {actor} casts {spell_name} (Resistance) : {Fore.CYAN}Magical resistance +{effect_value} this turn.{Style.RESET_ALL}")
-
-
-# Dictionary of spells in Latin (attack, healing, resistance)
-attack_spells = {
-    "Ignis": {"description": "Deals fire damage and may burn the enemy.", "damage": 3, "mana_cost": 3, "effect": "burn", "duration": 2, "chance": 0.6},
-    "Glacies": {"description": "Deals ice damage and may freeze the enemy.", "damage": 4, "mana_cost": 2, "effect": "freeze", "duration": 1, "chance": 0.3},
-    "Fulmen": {"description": "Deals lightning damage and may paralyze the enemy.", "damage": 2, "mana_cost": 2, "effect": "paralyze", "duration": 1, "chance": 0.4},
-}
-resistance_spells = {
-    "Fortitudo": {"description": "Increases the caster's magical resistance.", "resistance_boost": 3, "mana_cost": 2},
-    "Praesidium": {"description": "Temporary magical shield.", "resistance_boost": 2, "mana_cost": 1},
-    "Tutela": {"description": "Light magical protection.", "resistance_boost": 1, "mana_cost": 1},
-}
-healing_spells = {
-    "Vitalis": {"description": "Heals the caster's wounds.", "healing": 6, "mana_cost": 4},
-    "Vitae": {"description": "Restores some of the caster's health.", "healing": 4, "mana_cost": 3},
-    "Sanare": {"description": "Light healing.", "healing": 2, "mana_cost": 1},
-}
+        return f"{ascii} {actor} casts {spell_name} (Resistance) : {Fore.CYAN}Magical resistance +{effect_value} this turn.{Style.RESET_ALL}"
+
+
+# ---- Duel state ----
+# Both sides are stored as one flat, immutable tuple: hp, res, mana and the effect counters of the
+# player (fields 0-5), the same for MageBot (fields 6-11), then whose turn it is. It is hashable, so it
+# doubles as the transposition table key, and the turn logic below is written once for both sides.
+PLAYER = 0
+MAGEBOT = 1
+HP, RES, MANA, FROZEN, PARALYZED, BURNED = range(6)
+SIDE_SIZE = 6
+TURN = 2 * SIDE_SIZE
+
+DuelState = namedtuple("DuelState", [
+    "player_hp", "player_res", "player_mana", "player_frozen", "player_paralyzed", "player_burned",
+    "magebot_hp", "magebot_res", "magebot_mana", "magebot_frozen", "magebot_paralyzed", "magebot_burned",
+    "turn",
+])
+
+# Spell effect name -> effect counter, and counter labels for display
+EFFECT_COUNTERS = {"freeze": FROZEN, "paralyze": PARALYZED, "burn": BURNED}
+EFFECT_LABELS = {FROZEN: "frozen", PARALYZED: "paralyzed", BURNED: "burned"}
+
+# ---- Spell registry ----
+# Spells are loaded from spells.json (or the file named by $MAGEBOT_SPELLS), so they can be rebalanced
+# without touching the code, and compiled once at import. Spell ids follow mana cost (file order among
+# equal costs) and every stat is a flat list indexed by spell id, so the spells a side can afford are
+# always the ids below bisect_right(spell_costs, mana).
+SPELLS_PATH = os.environ.get("MAGEBOT_SPELLS") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "spells.json")
+
+class SpellKind(IntEnum):
+    ATTACK = 0
+    HEALING = 1
+    RESISTANCE = 2
+
+ATTACK, HEALING, RESISTANCE = SpellKind
+SPELL_KINDS = {"attack": ATTACK, "healing": HEALING, "resistance": RESISTANCE}
+SPELL_VALUE_KEYS = {ATTACK: "damage", HEALING: "healing", RESISTANCE: "resistance_boost"}
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def _is_probability(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= 1
+
+# Validated spell entries of `path`, in file order
+def load_spells(path=SPELLS_PATH):
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["spells"]
+    names = set()
+    for entry in entries:
+        kind = SPELL_KINDS.get(entry.get("kind"))
+        if not entry.get("name") or kind is None or not _is_count(entry.get(SPELL_VALUE_KEYS.get(kind))):
+            raise ValueError(f"{path}: invalid spell {entry!r}")
+        if entry["name"] in names:
+            raise ValueError(f"{path}: duplicate spell {entry['name']}")
+        if not _is_count(entry.get("mana_cost", 0)):
+            raise ValueError(f"{path}: invalid mana_cost for spell {entry['name']}")
+        if not _is_count(entry.get("duration", 0)):
+            raise ValueError(f"{path}: invalid duration for spell {entry['name']}")
+        if not _is_probability(entry.get("chance", 0.0)):
+            raise ValueError(f"{path}: invalid chance for spell {entry['name']}")
+        if entry.get("effect") is not None and (kind != ATTACK or entry["effect"] not in EFFECT_COUNTERS):
+            raise ValueError(f"{path}: invalid effect for spell {entry['name']}")
+        names.add(entry["name"])
+    return entries
+
+# Spell ids follow the mana cost (affordable spells are a prefix); the display keeps the file order
+_spell_file_entries = load_spells()
+_spell_entries = sorted(_spell_file_entries, key=lambda entry: entry.get("mana_cost", 0))
+spell_names = [entry["name"] for entry in _spell_entries]
+spell_ids = {name: spell_id for spell_id, name in enumerate(spell_names)}
+spell_kinds = [SPELL_KINDS[entry["kind"]] for entry in _spell_entries]
+spell_values = [entry[SPELL_VALUE_KEYS[kind]] for entry, kind in zip(_spell_entries, spell_kinds)]
+spell_costs = [entry.get("mana_cost", 0) for entry in _spell_entries]
+spell_effects = [EFFECT_COUNTERS.get(entry.get("effect")) for entry in _spell_entries]
+spell_durations = [entry.get("duration", 0) if entry.get("effect") else 0 for entry in _spell_entries]
+spell_chances = [entry.get("chance", 0.0) if entry.get("effect") else 0.0 for entry in _spell_entries]
+spell_descriptions = [entry.get("description", "") for entry in _spell_entries]
+# One row per spell id: (kind, value, mana_cost, effect_counter, duration, chance)
+spell_table = list(zip(spell_kinds, spell_values, spell_costs, spell_effects, spell_durations, spell_chances))
+
+# Read-only dict views in the historical spell format, for the display and the console rules
+def _spell_view(spell_id):
+    kind = spell_kinds[spell_id]
+    view = {"description": spell_descriptions[spell_id], SPELL_VALUE_KEYS[kind]: spell_values[spell_id], "mana_cost": spell_costs[spell_id]}
+    if spell_effects[spell_id] is not None:
+        view.update(effect=_spell_entries[spell_id]["effect"], duration=spell_durations[spell_id], chance=spell_chances[spell_id])
+    return MappingProxyType(view)
+
+def _spell_views(kinds):
+    spell_ids_in_file_order = [spell_ids[entry["name"]] for entry in _spell_file_entries]
+    return MappingProxyType({spell_names[spell_id]: _spell_view(spell_id) for spell_id in spell_ids_in_file_order if spell_kinds[spell_id] in kinds})
+
+all_spells = _spell_views(SpellKind)
+attack_spells = _spell_views((ATTACK,))
+healing_spells = _spell_views((HEALING,))
+resistance_spells = _spell_views((RESISTANCE,))
+
+def new_duel_state(hp=10, res=5, mana=15):
+    return DuelState(hp, res, mana, 0, 0, 0, hp, res, mana, 0, 0, 0, PLAYER)
+
+def active_effect_names(state, side):
+    base = side * SIDE_SIZE
+    return [EFFECT_LABELS[counter] for counter in (FROZEN, PARALYZED, BURNED) if state[base + counter] > 0]
+
+def affordable_spell_ids(state):
+    return range(bisect.bisect_right(spell_costs, state[state[TURN] * SIDE_SIZE + MANA]))
+
+# Start of turn: the side to move takes its burn tick
+def begin_turn(state):
+    base = state[TURN] * SIDE_SIZE
+    if state[base + BURNED] <= 0:
+        return state
+    s = list(state)
+    s[base + HP] -= BURN_DAMAGE
+    s[base + BURNED] -= 1
+    return DuelState._make(s)
+
+# Frozen or paralyzed: the side to move loses its action this turn
+def is_turn_skipped(state):
+    base = state[TURN] * SIDE_SIZE
+    return state[base + FROZEN] > 0 or state[base + PARALYZED] > 0
+
+def skip_turn(state):
+    base = state[TURN] * SIDE_SIZE
+    s = list(state)
+    s[base + FROZEN] = max(0, s[base + FROZEN] - 1)
+    s[base + PARALYZED] = max(0, s[base + PARALYZED] - 1)
+    return DuelState._make(s)
+
+# The side to move casts spell_id; proc=True means the spell's effect triggers on the target
+def apply_spell(state, spell_id, proc=False):
+    kind, value, cost, effect, duration, chance = spell_table[spell_id]
+    caster = state[TURN] * SIDE_SIZE
+    target = SIDE_SIZE - caster
+    s = list(state)
+    s[caster + MANA] -= cost
+    if kind == ATTACK:
+        s[target + HP] -= max(0, value - s[target + RES])
+        s[target + RES] = 0
+        if proc and effect is not None:
+            s[target + effect] = duration
+    elif kind == HEALING:
+        s[caster + HP] = min(MAX_HP, s[caster + HP] + value)
+    else:
+        s[caster + RES] += value
+    return DuelState._make(s)
+
+# End of turn: the side that moved regenerates mana, then the other side is to move
+def end_turn(state):
+    base = state[TURN] * SIDE_SIZE
+    s = list(state)
+    s[base + MANA] = min(MAX_MANA, s[base + MANA] + MANA_REGEN) if s[base + MANA] < MAX_MANA else s[base + MANA]
+    s[TURN] = 1 - state[TURN]
+    return DuelState._make(s)
+
+# All (spell_id, next_state) pairs for the side to move, burn tick and skipped turns included.
+# spell_id is None when the turn is skipped or no spell is affordable.
+def expand_turn(state):
+    state = begin_turn(state)
+    if is_turn_skipped(state):
+        return [(None, end_turn(skip_turn(state)))]
+    moves = [(spell_id, end_turn(apply_spell(state, spell_id))) for spell_id in affordable_spell_ids(state)]
+    if not moves:
+        return [(None, end_turn(state))]
+    return moves
+
+# Weighted outcomes of casting spell_id, effect roll included: [(probability, next_state), ...],
+# most likely first. A proc that changes nothing (e.g. the target is already frozen) is no chance node.
+def spell_outcomes(state, spell_id):
+    miss = end_turn(apply_spell(state, spell_id))
+    chance = spell_table[spell_id][5]
+    if chance > 0:
+        hit = end_turn(apply_spell(state, spell_id, True))
+        if hit != miss:
+            if chance >= 0.5:
+                return [(chance, hit), (1.0 - chance, miss)]
+            return [(1.0 - chance, miss), (chance, hit)]
+    return [(1.0, miss)]
+
+# Like expand_turn, with weighted outcomes: (spell_id, [(probability, next_state), ...])
+def expand_turn_outcomes(state):
+    state = begin_turn(state)
+    if is_turn_skipped(state):
+        return [(None, [(1.0, end_turn(skip_turn(state)))])]
+    moves = [(spell_id, spell_outcomes(state, spell_id)) for spell_id in affordable_spell_ids(state)]
+    if not moves:
+        return [(None, [(1.0, end_turn(state))])]
+    return moves
+
+
+# ---- Heuristic evaluation ----
+# One weight per feature, all computed as MageBot's value minus the player's:
+#   hp, res, mana   HP, resistance, mana (normalized to 0..1, then scaled by MAX_HP)
+#   control         turns the player will skip (frozen + paralyzed), minus MageBot's
+#   burn            burn ticks still due on the player, minus MageBot's
+#   tempo           mana the side will actually regenerate (none at MAX_MANA)
+# The extra features start at 0 (hand-picked weights); magebottune.py tunes them all by self-play.
+EVAL_FEATURES = ("hp", "res", "mana", "control", "burn", "tempo")
+DEFAULT_EVAL_WEIGHTS = (1.0, 0.5, 0.4, 0.0, 0.0, 0.0)
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "magebot_weights.json")
 
+# Weights used by evaluate_state (load_evaluation_weights replaces them at startup)
+evaluation_weights = DEFAULT_EVAL_WEIGHTS
 
 # Heuristic evaluation function for Minimax
-def evaluate_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana,
-                   w_hp=1.0, w_res=0.5, w_mana=0.4):
+def evaluate_state(state, weights=None):
+    w_hp, w_res, w_mana, w_control, w_burn, w_tempo = evaluation_weights if weights is None else weights
     # Positive score favors MageBot
-    hp_score = (magebot_hp - player_hp) * w_hp
-    res_score = (magebot_res - player_res) * w_res
+    hp_score = (state[MAGEBOT * SIDE_SIZE + HP] - state[HP]) * w_hp
+    res_score = (state[MAGEBOT * SIDE_SIZE + RES] - state[RES]) * w_res
     # Normalize mana between 0..1 and weight (multiplied by MAX_HP to keep similar scale)
-    mana_score = ((magebot_mana - player_mana) / MAX_MANA) * w_mana * MAX_HP
-    return hp_score + res_score + mana_score
+    mana_score = ((state[MAGEBOT * SIDE_SIZE + MANA] - state[MANA]) / MAX_MANA) * w_mana * MAX_HP
+    score = hp_score + res_score + mana_score
+    if w_control or w_burn or w_tempo:
+        control = state[FROZEN] + state[PARALYZED] - state[SIDE_SIZE + FROZEN] - state[SIDE_SIZE + PARALYZED]
+        burn = state[BURNED] - state[SIDE_SIZE + BURNED]
+        tempo = min(MANA_REGEN, MAX_MANA - state[SIDE_SIZE + MANA]) - min(MANA_REGEN, MAX_MANA - state[MANA])
+        score += control * w_control + burn * w_burn + tempo * w_tempo
+    return score
+
+# Weights file written by magebottune.py: {"weights": {feature: weight, ...}, ...}
+def read_evaluation_weights(path=WEIGHTS_PATH):
+    with open(path, encoding="utf-8") as f:
+        weights = json.load(f)["weights"]
+    unknown = set(weights) - set(EVAL_FEATURES)
+    if unknown:
+        raise ValueError(f"{path}: unknown evaluation features {sorted(unknown)}")
+    return tuple(float(weights.get(feature, default)) for feature, default in zip(EVAL_FEATURES, DEFAULT_EVAL_WEIGHTS))
+
+# Uses the tuned weights at `path` if the file exists (the shared transposition table is cleared, its
+# scores came from the previous weights). Returns the weights in use.
+def load_evaluation_weights(path=WEIGHTS_PATH, quiet=False):
+    global evaluation_weights
+    if not os.path.exists(path):
+        return evaluation_weights
+    try:
+        weights = read_evaluation_weights(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if not quiet:
+            print(f"{Fore.YELLOW}[Weights] Not used: {e}{Style.RESET_ALL}")
+        return evaluation_weights
+    if weights != evaluation_weights:
+        evaluation_weights = weights
+        transposition_table.clear()
+    return evaluation_weights
+
+# ---- Transposition table ----
+# Many spell orders reach the same position (e.g. Praesidium+Tutela vs Fortitudo), so search
+# results are cached on the full search state and reused across turns and duels.
+TT_MAX_ENTRIES = 200000
+TT_EXACT = 0  # score is the exact minimax value
+TT_LOWER = 1  # score is a lower bound (search failed high)
+TT_UPPER = 2  # score is an upper bound (search failed low)
+
+class TranspositionTable:
+    # Bounded LRU cache: key -> (score, flag). The least recently used entry is evicted when full.
+    def __init__(self, max_entries=TT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def probe(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key, score, flag=TT_EXACT):
+        if self.max_entries <= 0:
+            return
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.entries[key] = (score, flag)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Shared table: kept for the whole process so MageBot starts every turn (and every duel) warm
+transposition_table = TranspositionTable()
+
+# ---- Search instrumentation ----
+# Opt-in statistics for every MageBot decision, sent to pluggable sinks. The searches only test the
+# global `search_stats` (None while disabled) once per node, so a disabled monitor costs next to nothing.
+# Decisions never overlap (the ponder thread runs one search at a time and MageBot's own search waits
+# for it), so a single global is enough.
+class SearchStats:
+    def __init__(self):
+        self.nodes = Counter()  # depth left -> nodes visited (leaves at 0)
+        self.cutoffs = 0        # alpha-beta and chance node cutoffs
+        self.expanded = 0       # nodes whose moves were generated
+        self.moves = 0          # moves generated at those nodes (affordable spells, or the pass)
+
+    def total_nodes(self):
+        return sum(self.nodes.values())
+
+    # Average number of moves per expanded node, after the mana filter
+    def branching_factor(self):
+        return self.moves / self.expanded if self.expanded else 0.0
+
+# Counters of the decision running right now (None: instrumentation disabled)
+search_stats = None
+
+class SearchMonitor:
+    # `sinks` receive one record (a JSON friendly dict) per decision through sink.record(record)
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.decisions = 0
+        self.last = None  # record of the latest decision
+
+    # `ponder`: speculative search of the ponder thread, not a move MageBot plays; `ponder_hit`: False
+    # for a move searched after a ponder miss (None when pondering is off)
+    def decision(self, state, possible_spells, table, depth, time_budget, engine, weights=None, ponder=False, ponder_hit=None):
+        global search_stats
+        stats = search_stats = SearchStats()
+        hits, misses = (table.hits, table.misses) if table is not None else (0, 0)
+        started = time.perf_counter()
+        try:
+            name, searched_depth = _choose_spell(state, possible_spells, table, depth, time_budget, engine, weights)
+        finally:
+            search_stats = None
+        elapsed = time.perf_counter() - started
+        self._emit({
+            "engine": engine,
+            "spell": name,
+            "tablebase": searched_depth is None,
+            "depth": searched_depth,
+            "wall_ms": elapsed * 1000,
+            "root_moves": len(_candidate_spells(state, possible_spells)),
+            "nodes": stats.total_nodes(),
+            "nodes_by_depth": {str(left): count for left, count in sorted(stats.nodes.items(), reverse=True)},
+            "cutoffs": stats.cutoffs,
+            "expanded": stats.expanded,
+            "moves": stats.moves,
+            "cache_hits": table.hits - hits if table is not None else 0,
+            "cache_misses": table.misses - misses if table is not None else 0,
+            "branching_factor": stats.branching_factor(),
+            "ponder": ponder,
+            "ponder_hit": ponder_hit,
+        })
+        return name
+
+    # Move served from the ponder search of `pondered` (its record) after `elapsed` seconds of waiting:
+    # the search itself was recorded by the ponder thread, so this decision visited no nodes
+    def ponder_hit(self, pondered, elapsed):
+        self._emit(dict(pondered, wall_ms=elapsed * 1000, nodes=0, nodes_by_depth={}, cutoffs=0, expanded=0, moves=0,
+                        cache_hits=0, cache_misses=0, branching_factor=0.0, ponder=False, ponder_hit=True))
+
+    def _emit(self, record):
+        self.decisions += 1
+        self.last = dict(record, decision=self.decisions, pid=os.getpid(), time=time.time())
+        for sink in self.sinks:
+            sink.record(self.last)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+# Monitor of magebot_choose_spell (None: disabled)
+search_monitor = None
+
+def enable_search_monitor(*sinks):
+    global search_monitor
+    disable_search_monitor()
+    search_monitor = SearchMonitor(sinks)
+    return search_monitor
+
+def disable_search_monitor():
+    global search_monitor
+    if search_monitor is not None:
+        search_monitor.close()
+        search_monitor = None
+
+# One JSON line per decision, appended to `path` (buffered, flushed on close)
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+# Prometheus counters and a decision latency histogram per engine, in the text exposition format
+# (scraped over HTTP by magebotserver.py, or written to a node_exporter textfile by the CLI).
+# Ponder searches add to the search counters but are not decisions: the decision counters and the
+# latency histogram only cover the moves MageBot played.
+class PrometheusSink:
+    LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+    COUNTERS = (
+        ("magebot_decisions_total", "MageBot decisions", lambda record: int(not record["ponder"])),
+        ("magebot_tablebase_decisions_total", "MageBot decisions answered by the tablebase",
+         lambda record: int(record["tablebase"] and not record["ponder"])),
+        ("magebot_ponder_searches_total", "Speculative searches run during the player's turn", lambda record: int(record["ponder"])),
+        ("magebot_ponder_hits_total", "MageBot decisions served from a ponder search", lambda record: int(record["ponder_hit"] is True)),
+        ("magebot_search_nodes_total", "Search nodes visited", lambda record: record["nodes"]),
+        ("magebot_search_cutoffs_total", "Alpha-beta and chance node cutoffs", lambda record: record["cutoffs"]),
+        ("magebot_search_expanded_total", "Search nodes whose moves were generated", lambda record: record["expanded"]),
+        ("magebot_search_moves_total", "Moves generated at expanded nodes, after the mana filter", lambda record: record["moves"]),
+        ("magebot_cache_hits_total", "Transposition table hits", lambda record: record["cache_hits"]),
+        ("magebot_cache_misses_total", "Transposition table misses", lambda record: record["cache_misses"]),
+    )
+
+    def __init__(self, path=None):
+        self.path = path
+        self.counters = Counter()  # (metric, engine) -> value
+        self.buckets = Counter()   # (engine, bucket index) -> decisions
+        self.seconds = Counter()   # engine -> total decision time
+
+    def record(self, record):
+        engine = record["engine"]
+        for metric, _, value in self.COUNTERS:
+            self.counters[metric, engine] += value(record)
+        if record["ponder"]:
+            return
+        seconds = record["wall_ms"] / 1000
+        self.seconds[engine] += seconds
+        for index, bound in enumerate(self.LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[engine, index] += 1
+
+    def exposition(self):
+        engines = sorted(self.seconds)
+        lines = []
+        for metric, help_text, _ in self.COUNTERS:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for engine in engines:
+                lines.append(f'{metric}{{engine="{engine}"}} {self.counters[metric, engine]}')
+        lines.append("# HELP magebot_decision_seconds MageBot decision wall time")
+        lines.append("# TYPE magebot_decision_seconds histogram")
+        for engine in engines:
+            for index, bound in enumerate(self.LATENCY_BUCKETS):
+                lines.append(f'magebot_decision_seconds_bucket{{engine="{engine}",le="{bound}"}} {self.buckets[engine, index]}')
+            count = self.counters["magebot_decisions_total", engine]
+            lines.append(f'magebot_decision_seconds_bucket{{engine="{engine}",le="+Inf"}} {count}')
+            lines.append(f'magebot_decision_seconds_sum{{engine="{engine}"}} {self.seconds[engine]}')
+            lines.append(f'magebot_decision_seconds_count{{engine="{engine}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    # Written atomically on close when a path was given
+    def close(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.exposition())
+        os.replace(tmp_path, self.path)
+
+# cProfile hook: profiles whatever runs between enable() and save_profile() (a whole duel, a simulation)
+# and writes a pstats dump to `path`, printing the hottest functions on stderr
+def save_profile(profiler, path, top=25):
+    profiler.disable()
+    profiler.dump_stats(path)
+    print(f"[Profile] {path} (open with python -m pstats or snakeviz)", file=sys.stderr)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats("tottime").print_stats(top)
 
 # Minimax algorithm for MageBot's decision-making
-def minimax(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, depth, maximizing):
-    if player_hp <= 0:
+# Pass a TranspositionTable as `table` to cache results; without it the search is the plain full-width reference.
+# `weights` replaces evaluation_weights at the leaves (the table must then only hold scores from the same weights).
+def minimax(state, depth, table=None, weights=None):
+    stats = search_stats
+    if stats is not None:
+        stats.nodes[depth] += 1
+    if state[HP] <= 0:
         return 100  # MageBot wins
-    if magebot_hp <= 0:
+    if state[SIDE_SIZE + HP] <= 0:
         return -100  # Player wins
     if depth == 0:
-        return evaluate_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana)
+        return evaluate_state(state, weights)
+    if table is not None:
+        key = (state, depth)
+        entry = table.probe(key)
+        # Full-width search only ever stores exact scores
+        if entry is not None and entry[1] == TT_EXACT:
+            return entry[0]
+    moves = expand_turn(state)
+    if stats is not None:
+        stats.expanded += 1
+        stats.moves += len(moves)
     # MageBot's turn (maximizing) or Player's turn (minimizing)
-    if maximizing:
-        max_eval = -float('inf')
-        # MageBot plays: only consider spells it can afford
-        for name, spell in all_spells.items():
-            cost = spell.get("mana_cost", 0)
-            if cost > magebot_mana:
-                continue
-            if "damage" in spell:
-                dmg = max(0, spell["damage"] - player_res)
-                eval = minimax(player_hp - dmg, 0, player_mana, magebot_hp, magebot_res, magebot_mana - cost, depth-1, False)
-            elif "healing" in spell:
-                new_hp = min(MAX_HP, magebot_hp + spell["healing"])
-                eval = minimax(player_hp, player_res, player_mana, new_hp, magebot_res, magebot_mana - cost, depth-1, False)
-            elif "resistance_boost" in spell:
-                new_res = magebot_res + spell["resistance_boost"]
-                eval = minimax(player_hp, player_res, player_mana, magebot_hp, new_res, magebot_mana - cost, depth-1, False)
-            else:
-                eval = evaluate_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana)
-            max_eval = max(max_eval, eval)
-        return max_eval
+    if state[TURN] == MAGEBOT:
+        best = -float('inf')
+        for spell_id, child in moves:
+            best = max(best, minimax(child, depth-1, table, weights))
     else:
-        min_eval = float('inf')
-        # Player plays: only consider spells they can afford
-        for name, spell in all_spells.items():
-            cost = spell.get("mana_cost", 0)
-            if cost > player_mana:
-                continue
-            if "damage" in spell:
-                dmg = max(0, spell["damage"] - magebot_res)
-                eval = minimax(player_hp, player_res, player_mana - cost, magebot_hp - dmg, 0, magebot_mana, depth-1, True)
-            elif "healing" in spell:
-                new_hp = min(MAX_HP, player_hp + spell["healing"])
-                eval = minimax(new_hp, player_res, player_mana - cost, magebot_hp, magebot_res, magebot_mana, depth-1, True)
-            elif "resistance_boost" in spell:
-                new_res = player_res + spell["resistance_boost"]
-                eval = minimax(player_hp, new_res, player_mana - cost, magebot_hp, magebot_res, magebot_mana, depth-1, True)
+        best = float('inf')
+        for spell_id, child in moves:
+            best = min(best, minimax(child, depth-1, table, weights))
+    if table is not None:
+        table.store(key, best)
+    return best
+
+# ---- Alpha-beta search with iterative deepening ----
+MAGEBOT_SEARCH_DEPTH = 2      # fixed depth of the reference minimax
+MAGEBOT_TIME_BUDGET = 0.05    # seconds per MageBot move for the iterative deepening search
+MAGEBOT_MAX_DEPTH = 10        # hard cap for iterative deepening
+
+class _SearchTimeout(Exception):
+    pass
+
+# History heuristic: spells that caused a cutoff are tried first (reset at every decision)
+_history_scores = {}
+
+# Static move ordering: immediate gain of a spell for the caster (damage minus resistance first)
+def _spell_gain(state, spell_id):
+    if spell_id is None:
+        return 0
+    kind, value = spell_table[spell_id][:2]
+    caster = state[TURN] * SIDE_SIZE
+    if kind == ATTACK:
+        return value - state[SIDE_SIZE - caster + RES]
+    if kind == HEALING:
+        return min(value, MAX_HP - state[caster + HP])
+    return value
+
+def _ordered_moves(state):
+    turn = state[TURN]
+    moves = expand_turn(state)
+    moves.sort(key=lambda move: (-_history_scores.get((turn, move[0]), 0), -_spell_gain(state, move[0])))
+    return moves
+
+# Fail-soft alpha-beta: same value as minimax() whenever the result lies inside (alpha, beta)
+def alphabeta(state, depth, alpha, beta, table=None, deadline=None, weights=None):
+    stats = search_stats
+    if stats is not None:
+        stats.nodes[depth] += 1
+    if state[HP] <= 0:
+        return 100  # MageBot wins
+    if state[SIDE_SIZE + HP] <= 0:
+        return -100  # Player wins
+    if depth == 0:
+        return evaluate_state(state, weights)
+    if deadline is not None and time.perf_counter() > deadline:
+        raise _SearchTimeout()
+    alpha_orig, beta_orig = alpha, beta
+    if table is not None:
+        key = (state, depth)
+        entry = table.probe(key)
+        if entry is not None:
+            score, flag = entry
+            if flag == TT_EXACT:
+                return score
+            if flag == TT_LOWER:
+                alpha = max(alpha, score)
             else:
-                eval = evaluate_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana)
-            min_eval = min(min_eval, eval)
-        return min_eval
-# Spell choice by MageBot using Minimax
-def magebot_choose_spell(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, magebot_max_hp, possible_spells):
-    best_score = -float('inf')
-    best_spell = None
-    # Filter healing spells if MageBot is already at max HP
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+    turn = state[TURN]
+    moves = _ordered_moves(state)
+    if stats is not None:
+        stats.expanded += 1
+        stats.moves += len(moves)
+    if turn == MAGEBOT:
+        best = -float('inf')
+        for spell_id, child in moves:
+            eval = alphabeta(child, depth-1, alpha, beta, table, deadline, weights)
+            if eval > best:
+                best = eval
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                _history_scores[(turn, spell_id)] = _history_scores.get((turn, spell_id), 0) + depth * depth
+                if stats is not None:
+                    stats.cutoffs += 1
+                break
+    else:
+        best = float('inf')
+        for spell_id, child in moves:
+            eval = alphabeta(child, depth-1, alpha, beta, table, deadline, weights)
+            if eval < best:
+                best = eval
+            if best < beta:
+                beta = best
+            if alpha >= beta:
+                _history_scores[(turn, spell_id)] = _history_scores.get((turn, spell_id), 0) + depth * depth
+                if stats is not None:
+                    stats.cutoffs += 1
+                break
+    if table is not None:
+        if best <= alpha_orig:
+            table.store(key, best, TT_UPPER)
+        elif best >= beta_orig:
+            table.store(key, best, TT_LOWER)
+        else:
+            table.store(key, best, TT_EXACT)
+    return best
+
+# Spells MageBot may cast in `state` (its turn, burn tick already applied).
+# Healing spells are filtered if MageBot is already at max HP.
+def _candidate_spells(state, possible_spells=None):
+    if possible_spells is None:
+        possible_spells = [spell_names[spell_id] for spell_id in affordable_spell_ids(state)]
     filtered_spells = []
     for name in possible_spells:
-        spell = all_spells[name]
-        if "healing" in spell and magebot_hp >= magebot_max_hp:
+        if spell_kinds[spell_ids[name]] == HEALING and state.magebot_hp >= MAX_HP:
             continue
         filtered_spells.append(name)
     # If all are filtered, fall back to original list
     if not filtered_spells:
         filtered_spells = possible_spells
+    return [name for name in filtered_spells if spell_costs[spell_ids[name]] <= state.magebot_mana]
 
-    for name in filtered_spells:
-        spell = all_spells[name]
-        cost = spell.get("mana_cost", 0)
-        if cost > magebot_mana:
-            continue
-        if "damage" in spell:
-            dmg = max(0, spell["damage"] - player_res)
-            score = minimax(player_hp - dmg, 0, player_mana, magebot_hp, magebot_res, magebot_mana - cost, 2, False)
-        elif "healing" in spell:
-            new_hp = min(MAX_HP, magebot_hp + spell["healing"])
-            score = minimax(player_hp, player_res, player_mana, new_hp, magebot_res, magebot_mana - cost, 2, False)
-        elif "resistance_boost" in spell:
-            new_res = magebot_res + spell["resistance_boost"]
-            score = minimax(player_hp, player_res, player_mana, magebot_hp, new_res, magebot_mana - cost, 2, False)
+# One root iteration at a fixed depth. Root moves keep their original order and a move must be
+# strictly better to replace the current best, exactly like magebot_choose_spell's minimax loop.
+def _alphabeta_root(state, candidates, depth, table, deadline, weights=None):
+    best_score = -float('inf')
+    best_spell = None
+    for name in candidates:
+        child = end_turn(apply_spell(state, spell_ids[name]))
+        score = alphabeta(child, depth, best_score, float('inf'), table, deadline, weights)
+        if score > best_score:
+            best_score = score
+            best_spell = name
+    return best_spell, best_score
+
+# Iterative deepening under a wall-clock budget.
+# Returns (best_spell, best_score, depth) from the deepest iteration that completed in time.
+def iterative_deepening_search(state, possible_spells=None, time_budget=MAGEBOT_TIME_BUDGET, max_depth=MAGEBOT_MAX_DEPTH, table=transposition_table,
+                               weights=None):
+    _history_scores.clear()
+    candidates = _candidate_spells(state, possible_spells)
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    # Depth 0 always runs to completion so MageBot has a move even on a tiny budget
+    best_spell, best_score = _alphabeta_root(state, candidates, 0, table, None, weights)
+    completed_depth = 0
+    for depth in range(1, max_depth + 1):
+        try:
+            result = _alphabeta_root(state, candidates, depth, table, deadline, weights)
+        except _SearchTimeout:
+            break
+        best_spell, best_score = result
+        completed_depth = depth
+    return best_spell, best_score, completed_depth
+
+# ---- Batched minimax (NumPy) ----
+# Same full-width minimax and same scores as minimax(), but the tree is expanded one ply at a time for
+# a whole frontier of states at once: the spells are applied from a spell matrix, the leaves are scored
+# by evaluate_states and the values are reduced to the parents with min/max. Frontiers larger than
+# BATCH_MAX_ROWS states are searched in chunks to bound memory.
+BATCH_MAX_ROWS = 1 << 18
+SPELL_DAMAGE, SPELL_HEALING, SPELL_RESISTANCE, SPELL_MANA_COST = range(4)
+
+def _spell_matrix():
+    matrix = np.zeros((len(spell_names), 4), dtype=np.int16)
+    matrix[np.arange(len(spell_names)), spell_kinds] = spell_values  # kind order matches the first three columns
+    matrix[:, SPELL_MANA_COST] = spell_costs
+    return matrix
+
+spell_matrix = _spell_matrix() if np is not None else None
+# Spell kinds as masks: a kind does not follow from the values (an attack with 0 damage still breaks resistance)
+spell_attack_mask = np.array([kind == ATTACK for kind in spell_kinds]) if np is not None else None
+spell_healing_mask = np.array([kind == HEALING for kind in spell_kinds]) if np is not None else None
+
+# evaluate_state over an (N, 13) array of states, bit for bit
+def evaluate_states(states, weights=None):
+    w_hp, w_res, w_mana, w_control, w_burn, w_tempo = evaluation_weights if weights is None else weights
+    states = states.astype(np.float64)
+    hp_score = (states[:, MAGEBOT * SIDE_SIZE + HP] - states[:, HP]) * w_hp
+    res_score = (states[:, MAGEBOT * SIDE_SIZE + RES] - states[:, RES]) * w_res
+    mana_score = ((states[:, MAGEBOT * SIDE_SIZE + MANA] - states[:, MANA]) / MAX_MANA) * w_mana * MAX_HP
+    score = hp_score + res_score + mana_score
+    if w_control or w_burn or w_tempo:
+        control = states[:, FROZEN] + states[:, PARALYZED] - states[:, SIDE_SIZE + FROZEN] - states[:, SIDE_SIZE + PARALYZED]
+        burn = states[:, BURNED] - states[:, SIDE_SIZE + BURNED]
+        tempo = np.minimum(MANA_REGEN, MAX_MANA - states[:, SIDE_SIZE + MANA]) - np.minimum(MANA_REGEN, MAX_MANA - states[:, MANA])
+        score += control * w_control + burn * w_burn + tempo * w_tempo
+    return score
+
+# expand_turn for every row of `states`. Returns the children grouped by parent, in expand_turn's
+# order, and the number of children of each parent.
+def expand_turns(states):
+    rows = np.arange(len(states))
+    mover = states[:, TURN].astype(np.intp) * SIDE_SIZE
+    target = SIDE_SIZE - mover
+    s = states.copy()
+    # Burn tick, then frozen/paralyzed sides skip, otherwise every affordable spell (or a pass)
+    burned = s[rows, mover + BURNED] > 0
+    s[rows, mover + HP] -= BURN_DAMAGE * burned
+    s[rows, mover + BURNED] -= burned
+    skipped = (s[rows, mover + FROZEN] > 0) | (s[rows, mover + PARALYZED] > 0)
+    spell_count = len(spell_matrix)
+    affordable = (s[rows, mover + MANA][:, None] >= spell_matrix[:, SPELL_MANA_COST]) & ~skipped[:, None]
+    moves = np.concatenate([affordable, ~affordable.any(axis=1)[:, None]], axis=1)
+
+    # Slot i < spell_count casts spell i, the last slot skips or passes
+    c = np.repeat(s[:, None, :], spell_count + 1, axis=1)
+    cast = slice(0, spell_count)
+    c[rows, cast, mover + MANA] -= spell_matrix[:, SPELL_MANA_COST]
+    attack = spell_attack_mask
+    target_res = c[rows, cast, target + RES]
+    c[rows, cast, target + HP] -= np.where(attack, np.maximum(0, spell_matrix[:, SPELL_DAMAGE] - target_res), 0)
+    c[rows, cast, target + RES] = np.where(attack, 0, target_res)
+    healing = spell_healing_mask
+    c[rows, cast, mover + HP] = np.where(healing, np.minimum(MAX_HP, c[rows, cast, mover + HP] + spell_matrix[:, SPELL_HEALING]), c[rows, cast, mover + HP])
+    c[rows, cast, mover + RES] += spell_matrix[:, SPELL_RESISTANCE]
+    c[rows, spell_count, mover + FROZEN] = np.maximum(0, c[rows, spell_count, mover + FROZEN] - 1)
+    c[rows, spell_count, mover + PARALYZED] = np.maximum(0, c[rows, spell_count, mover + PARALYZED] - 1)
+
+    children = c[moves]
+    # End of turn: mana regeneration of the side that moved, then the other side is to move
+    child_rows = np.arange(len(children))
+    child_mana = mover.repeat(moves.sum(axis=1)) + MANA
+    mana = children[child_rows, child_mana]
+    children[child_rows, child_mana] = np.where(mana < MAX_MANA, np.minimum(MAX_MANA, mana + MANA_REGEN), mana)
+    children[:, TURN] = 1 - children[:, TURN]
+    return children, moves.sum(axis=1)
+
+# minimax() value of every row of `states`
+def batch_minimax(states, depth, weights=None):
+    branching = len(spell_matrix) ** depth
+    if len(states) > 1 and len(states) * branching > BATCH_MAX_ROWS:
+        chunk = max(1, BATCH_MAX_ROWS // branching)
+        return np.concatenate([batch_minimax(states[start:start + chunk], depth, weights) for start in range(0, len(states), chunk)])
+    stats = search_stats
+    if stats is not None:
+        stats.nodes[depth] += len(states)
+    values = np.empty(len(states))
+    player_dead = states[:, HP] <= 0
+    magebot_dead = states[:, SIDE_SIZE + HP] <= 0
+    values[magebot_dead] = -100  # Player wins
+    values[player_dead] = 100    # MageBot wins (checked first by minimax)
+    live = ~(player_dead | magebot_dead)
+    if depth == 0:
+        values[live] = evaluate_states(states[live], weights)
+        return values
+    parents = states[live]
+    if len(parents):
+        children, counts = expand_turns(parents)
+        if stats is not None:
+            stats.expanded += len(parents)
+            stats.moves += len(children)
+        child_values = batch_minimax(children, depth - 1, weights)
+        starts = np.cumsum(counts) - counts
+        values[live] = np.where(parents[:, TURN] == MAGEBOT, np.maximum.reduceat(child_values, starts),
+                                np.minimum.reduceat(child_values, starts))
+    return values
+
+# magebot_choose_spell's minimax decision with every root move searched in one batch.
+# Returns (best_spell, best_score); ties go to the first candidate, like the scalar loop.
+def batch_minimax_search(state, possible_spells=None, depth=MAGEBOT_SEARCH_DEPTH, weights=None):
+    if np is None:
+        raise ImportError("the batch engine needs numpy (pip install numpy)")
+    candidates = _candidate_spells(state, possible_spells)
+    if not candidates:
+        return None, -float('inf')
+    children = np.array([end_turn(apply_spell(state, spell_ids[name])) for name in candidates], dtype=np.int16)
+    scores = batch_minimax(children, depth, weights)
+    best = int(np.argmax(scores))
+    return candidates[best], float(scores[best])
+
+# ---- Expectimax search with chance nodes ----
+# Plans against the game actually played: every effect roll is a chance node weighted by the spell's
+# chance. Chance nodes are pruned Star1-style (bounds from the known score range) and max/min nodes
+# with alpha-beta; a node budget caps the work per decision.
+EXPECTIMAX_DEPTH = 3
+EXPECTIMAX_NODE_BUDGET = 20000
+SCORE_MIN = -100  # every expectimax score lies in [SCORE_MIN, SCORE_MAX] (leaf evaluations are clamped)
+SCORE_MAX = 100
+_EXPECTIMAX_KEY = "expectimax"  # tags expectimax entries, which share the transposition table with minimax
+
+class ExpectimaxSearch:
+    def __init__(self, table=None, node_budget=None, deadline=None, weights=None):
+        self.table = table
+        self.node_budget = node_budget
+        self.deadline = deadline
+        self.weights = weights
+        self.nodes = 0
+
+    # Value of `state` for MageBot, exact inside (alpha, beta), otherwise a bound on the wrong side of the window
+    def value(self, state, depth, alpha=SCORE_MIN, beta=SCORE_MAX):
+        stats = search_stats
+        if stats is not None:
+            stats.nodes[depth] += 1
+        if state[HP] <= 0:
+            return SCORE_MAX  # MageBot wins
+        if state[SIDE_SIZE + HP] <= 0:
+            return SCORE_MIN  # Player wins
+        if depth == 0:
+            return max(SCORE_MIN, min(SCORE_MAX, evaluate_state(state, self.weights)))
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise _SearchTimeout()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise _SearchTimeout()
+        alpha_orig, beta_orig = alpha, beta
+        table = self.table
+        if table is not None:
+            key = (state, depth, _EXPECTIMAX_KEY)
+            entry = table.probe(key)
+            if entry is not None:
+                score, flag = entry
+                if flag == TT_EXACT:
+                    return score
+                if flag == TT_LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        moves = expand_turn_outcomes(state)
+        moves.sort(key=lambda move: -_spell_gain(state, move[0]))
+        if stats is not None:
+            stats.expanded += 1
+            stats.moves += len(moves)
+        if state[TURN] == MAGEBOT:
+            best = -float('inf')
+            for spell_id, outcomes in moves:
+                eval = self.chance(outcomes, depth-1, alpha, beta)
+                if eval > best:
+                    best = eval
+                if best > alpha:
+                    alpha = best
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoffs += 1
+                    break
+        else:
+            best = float('inf')
+            for spell_id, outcomes in moves:
+                eval = self.chance(outcomes, depth-1, alpha, beta)
+                if eval < best:
+                    best = eval
+                if best < beta:
+                    beta = best
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoffs += 1
+                    break
+        # An empty window (alpha_orig >= beta_orig) says nothing about the side of the bound
+        if table is not None and alpha_orig < beta_orig:
+            if best <= alpha_orig:
+                table.store(key, best, TT_UPPER)
+            elif best >= beta_orig:
+                table.store(key, best, TT_LOWER)
+            else:
+                table.store(key, best, TT_EXACT)
+        return best
+
+    # Star1: each outcome is searched with the window that could still move the weighted sum across
+    # (alpha, beta), assuming the worst/best score for the outcomes not searched yet
+    def chance(self, outcomes, depth, alpha, beta):
+        if len(outcomes) == 1:
+            return self.value(outcomes[0][1], depth, alpha, beta)
+        total = 0.0
+        remaining = 1.0
+        for probability, child in outcomes:
+            remaining -= probability
+            child_alpha = max(SCORE_MIN, (alpha - total - remaining * SCORE_MAX) / probability)
+            child_beta = min(SCORE_MAX, (beta - total - remaining * SCORE_MIN) / probability)
+            if child_alpha >= child_beta:
+                # No score of this outcome brings the sum back inside (alpha, beta): return the bound
+                if search_stats is not None:
+                    search_stats.cutoffs += 1
+                if child_alpha >= SCORE_MAX:
+                    return total + (probability + remaining) * SCORE_MAX
+                return total + (probability + remaining) * SCORE_MIN
+            total += probability * self.value(child, depth, child_alpha, child_beta)
+            if total + remaining * SCORE_MIN >= beta:
+                if search_stats is not None:
+                    search_stats.cutoffs += 1
+                return total + remaining * SCORE_MIN
+            if total + remaining * SCORE_MAX <= alpha:
+                if search_stats is not None:
+                    search_stats.cutoffs += 1
+                return total + remaining * SCORE_MAX
+        return total
+
+    # Root moves in their original order, a move must be strictly better to replace the best one.
+    # A forced win (SCORE_MAX) cannot be improved on, the remaining moves are not searched.
+    def root(self, state, candidates, depth):
+        best_score = -float('inf')
+        best_spell = None
+        for name in candidates:
+            score = self.chance(spell_outcomes(state, spell_ids[name]), depth, max(SCORE_MIN, best_score), SCORE_MAX)
+            if score > best_score:
+                best_score = score
+                best_spell = name
+                if best_score >= SCORE_MAX:
+                    break
+        return best_spell, best_score
+
+# Expectimax decision with iterative deepening up to `depth`; the node budget (and optional time budget)
+# stops the search, keeping the move of the deepest completed iteration. Returns (best_spell, best_score, depth).
+def expectimax_search(state, possible_spells=None, depth=EXPECTIMAX_DEPTH, node_budget=EXPECTIMAX_NODE_BUDGET, time_budget=None, table=transposition_table,
+                      weights=None):
+    candidates = _candidate_spells(state, possible_spells)
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    search = ExpectimaxSearch(table, node_budget, deadline, weights)
+    # Depth 0 always runs to completion so MageBot has a move whatever the budget
+    best_spell, best_score = ExpectimaxSearch(table, weights=weights).root(state, candidates, 0)
+    completed_depth = 0
+    for current_depth in range(1, depth + 1):
+        try:
+            result = search.root(state, candidates, current_depth)
+        except _SearchTimeout:
+            break
+        best_spell, best_score = result
+        completed_depth = current_depth
+    return best_spell, best_score, completed_depth
+
+# ---- Monte Carlo Tree Search ----
+# UCT over the game actually played: effect rolls are sampled with the spell's chance, in the tree (one
+# child per outcome reached) as in the playouts. Playouts follow the duel's turn rules and cast the
+# affordable spell with the best immediate gain, or a random one with probability MCTS_PLAYOUT_EPSILON
+# (uniformly random playouts say next to nothing about a position), until the duel ends or
+# MCTS_PLAYOUT_TURNS turns have passed: the heuristic evaluation then decides.
+# Rewards are MageBot's chance of winning, in [0, 1]; each side plays the move with the best UCT bound
+# for itself and the decision is the most visited root move. The search is anytime (iteration and time
+# budgets, it always has a move), and the tree is kept between decisions: the next search starts from
+# the subtree of the position actually reached instead of from scratch.
+# With workers > 1 the rollouts also run in a process pool, either root-parallel (independent trees
+# whose root visit counts are summed) or leaf-parallel (every new leaf is played out in every worker,
+# worth it only when playouts are long enough to pay for the inter-process round trip).
+MCTS_ITERATIONS = 5000
+MCTS_EXPLORATION = 0.25    # UCT exploration constant (rewards are in [0, 1], differences are small)
+MCTS_PLAYOUT_TURNS = 10
+MCTS_PLAYOUT_EPSILON = 0.3
+MCTS_EVAL_SCALE = 10.0     # heuristic score counted as a sure win when a playout reaches its horizon
+MCTS_MAX_NODES = 200000    # the kept tree is dropped once this many nodes were created
+MCTS_WORKERS = 1
+MCTS_PARALLEL_MODES = ("root", "leaf")
+MCTS_PARALLEL = "root"
+MCTS_LEAF_PLAYOUTS = 16    # playouts per worker for every new leaf (leaf-parallel mode)
+
+# MageBot's reward once `state` (burn tick applied) ends the duel, None while it goes on
+def _mcts_reward(state):
+    if state[HP] <= 0:
+        return 1.0
+    if state[SIDE_SIZE + HP] <= 0:
+        return 0.0
+    return None
+
+# Playout from `state` (start of a turn) with the real effect rolls; returns MageBot's reward
+def mcts_playout(state, rng, weights=None, max_turns=MCTS_PLAYOUT_TURNS):
+    for _ in range(max_turns):
+        state = begin_turn(state)
+        reward = _mcts_reward(state)
+        if reward is not None:
+            return reward
+        if is_turn_skipped(state):
+            state = skip_turn(state)
+        else:
+            count = bisect.bisect_right(spell_costs, state[state[TURN] * SIDE_SIZE + MANA])
+            if count:
+                if rng.random() < MCTS_PLAYOUT_EPSILON:
+                    spell_id = int(rng.random() * count)
+                else:
+                    spell_id = max(range(count), key=lambda spell_id: _spell_gain(state, spell_id))
+                proc = spell_effects[spell_id] is not None and rng.random() < spell_chances[spell_id]
+                state = apply_spell(state, spell_id, proc)
+        state = end_turn(state)
+        reward = _mcts_reward(state)
+        if reward is not None:
+            return reward
+    return 0.5 + 0.5 * max(-1.0, min(1.0, evaluate_state(state, weights) / MCTS_EVAL_SCALE))
+
+class MctsNode:
+    __slots__ = ("state", "moves", "visits", "totals", "n", "children", "reward")
+
+    def __init__(self, state):
+        self.state = state      # start of a turn, burn tick not applied (except for a fresh root)
+        self.moves = None       # [(spell_id, [(probability, next_state), ...]), ...] once expanded
+        self.visits = None      # per move
+        self.totals = None      # per move, sum of MageBot's rewards
+        self.n = 0
+        self.children = {}      # next_state -> MctsNode
+        self.reward = None      # set when the duel is over in this node
+
+class MctsTree:
+    def __init__(self, max_nodes=MCTS_MAX_NODES):
+        self.max_nodes = max_nodes
+        self.root = None
+        self.created = 0
+        self.reused = 0         # root visits kept from the previous decision
+        self.max_depth = 0      # deepest node reached by the last search
+
+    def clear(self):
+        self.root = None
+        self.created = 0
+
+    # Root for MageBot's position `state` (burn tick applied): the node two plies below the previous
+    # root that leads to it, whatever its stats, or a fresh node
+    def advance(self, state):
+        root = self.root
+        self.root = None
+        if root is not None and self.created < self.max_nodes:
+            if root.state == state:
+                self.root = root
+            else:
+                for child in root.children.values():
+                    for grandchild in child.children.values():
+                        if grandchild.moves is not None and begin_turn(grandchild.state) == state:
+                            self.root = grandchild
+                            break
+                    if self.root is not None:
+                        break
+        if self.root is None:
+            self.clear()
+            self.root = MctsNode(state)
+            _mcts_expand(self.root, ticked=True)
+        self.reused = self.root.n
+        self.max_depth = 0
+        return self.root
+
+    # One selection / expansion / playout / backpropagation pass. `allowed`: spell ids allowed at the root.
+    # With an executor, the new leaf is played out in every worker (leaf parallelism).
+    def iterate(self, rng, allowed=None, weights=None, executor=None, workers=1):
+        stats = search_stats
+        node = self.root
+        path = []
+        while node.moves is not None and node.reward is None:
+            index = _mcts_select(node, allowed if node is self.root else None)
+            outcomes = node.moves[index][1]
+            child_state = outcomes[0][1]
+            if len(outcomes) > 1:
+                roll = rng.random()
+                for probability, child_state in outcomes:
+                    roll -= probability
+                    if roll < 0:
+                        break
+            path.append((node, index))
+            child = node.children.get(child_state)
+            if child is None:
+                child = node.children[child_state] = MctsNode(child_state)
+                self.created += 1
+                if stats is not None:
+                    stats.nodes[len(path)] += 1
+            node = child
+        if len(path) > self.max_depth:
+            self.max_depth = len(path)
+        if node.reward is None:
+            _mcts_expand(node)
+            if stats is not None and node.moves:
+                stats.expanded += 1
+                stats.moves += len(node.moves)
+        if node.reward is not None:
+            total, count = node.reward, 1
+        elif executor is not None:
+            futures = [executor.submit(_mcts_playout_job, node.state, rng.randrange(1 << 63), MCTS_LEAF_PLAYOUTS, weights)
+                       for _ in range(workers)]
+            total, count = sum(future.result() for future in futures), workers * MCTS_LEAF_PLAYOUTS
         else:
-            score = evaluate_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana)
+            total, count = mcts_playout(node.state, rng, weights), 1
+        for parent, index in path:
+            parent.visits[index] += count
+            parent.totals[index] += total
+            parent.n += count
+
+# Moves of `node`, best immediate gain first (tried first while unvisited). `ticked`: the burn tick is
+# already applied (fresh root), so the moves are the affordable spells only.
+def _mcts_expand(node, ticked=False):
+    state = node.state if ticked else begin_turn(node.state)
+    node.reward = _mcts_reward(state)
+    if node.reward is not None:
+        node.moves = []
+        return
+    if ticked:
+        node.moves = [(spell_id, spell_outcomes(state, spell_id)) for spell_id in affordable_spell_ids(state)]
+    else:
+        node.moves = expand_turn_outcomes(node.state)
+    node.moves.sort(key=lambda move: -_spell_gain(state, move[0]))
+    node.visits = [0] * len(node.moves)
+    node.totals = [0.0] * len(node.moves)
+
+# UCT: unvisited moves first, then the best mean reward for the side to move plus the exploration bonus
+def _mcts_select(node, allowed=None):
+    visits = node.visits
+    moves = node.moves
+    for index, count in enumerate(visits):
+        if count == 0 and (allowed is None or moves[index][0] in allowed):
+            return index
+    log_n = math.log(node.n)
+    sign = 1.0 if node.state[TURN] == MAGEBOT else -1.0
+    best_score = -float('inf')
+    best_index = 0
+    for index, count in enumerate(visits):
+        if allowed is not None and moves[index][0] not in allowed:
+            continue
+        score = sign * (node.totals[index] / count - 0.5) + MCTS_EXPLORATION * math.sqrt(log_n / count)
         if score > best_score:
             best_score = score
+            best_index = index
+    return best_index
+
+# Shared by every search in the process; replaced when the worker count changes
+_mcts_executor = None
+_mcts_executor_workers = 0
+
+def _mcts_pool(workers):
+    global _mcts_executor, _mcts_executor_workers
+    if _mcts_executor is None or _mcts_executor_workers != workers:
+        close_mcts_pool()
+        _mcts_executor = ProcessPoolExecutor(max_workers=workers)
+        _mcts_executor_workers = workers
+    return _mcts_executor
+
+def close_mcts_pool():
+    global _mcts_executor
+    if _mcts_executor is not None:
+        _mcts_executor.shutdown(cancel_futures=True)
+        _mcts_executor = None
+
+# Worker tasks (weights are passed along: a worker process does not share evaluation_weights)
+def _mcts_playout_job(state, seed, count, weights):
+    rng = random.Random(seed)
+    return sum(mcts_playout(state, rng, weights) for _ in range(count))
+
+# Independent search on a fresh tree; returns {spell_id: (visits, total reward)} at the root
+def _mcts_root_job(state, possible_spells, iterations, time_budget, seed, weights):
+    tree = MctsTree()
+    _mcts_run(tree, state, possible_spells, iterations, time_budget, random.Random(seed), weights)
+    return {spell_id: (tree.root.visits[index], tree.root.totals[index]) for index, (spell_id, _) in enumerate(tree.root.moves)}
+
+# Returns the root and the number of iterations run
+def _mcts_run(tree, state, possible_spells, iterations, time_budget, rng, weights, executor=None, workers=1):
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    allowed = {spell_ids[name] for name in _candidate_spells(state, possible_spells)}
+    root = tree.advance(state)
+    done = 0
+    while done < iterations:
+        if deadline is not None and done >= len(allowed) and time.perf_counter() > deadline:
+            break
+        tree.iterate(rng, allowed, weights, executor, workers)
+        done += 1
+    return root, done
+
+# MCTS decision for MageBot (its turn, burn tick applied) on `tree`, kept for the next decision.
+# Stops after `iterations` or `time_budget` seconds, whichever comes first, and always after at least one
+# iteration per candidate spell. Returns (best_spell, expected reward, depth of the deepest node reached).
+def mcts_search(state, possible_spells=None, iterations=MCTS_ITERATIONS, time_budget=None, workers=MCTS_WORKERS, parallel=MCTS_PARALLEL, tree=None, seed=None,
+                weights=None):
+    if parallel not in MCTS_PARALLEL_MODES:
+        raise ValueError(f"Unknown MCTS parallel mode: {parallel}")
+    if tree is None:
+        tree = mcts_tree
+    candidates = _candidate_spells(state, possible_spells)
+    if not candidates:
+        return None, 0.5, 0  # nothing to cast: MageBot passes
+    rng = random.Random(seed)
+    if weights is None:
+        weights = evaluation_weights
+    iterations = max(iterations, len(candidates))
+    executor = _mcts_pool(workers) if workers > 1 else None
+    futures = []
+    if executor is not None and parallel == "root":
+        # The kept tree takes one share in this process, fresh trees the others
+        share = -(-iterations // workers)
+        futures = [executor.submit(_mcts_root_job, state, candidates, share, time_budget, rng.randrange(1 << 63), weights)
+                   for _ in range(workers - 1)]
+        root, _ = _mcts_run(tree, state, candidates, share, time_budget, rng, weights)
+    else:
+        root, _ = _mcts_run(tree, state, candidates, iterations, time_budget, rng, weights, executor, workers)
+    counts = {spell_id: [root.visits[index], root.totals[index]] for index, (spell_id, _) in enumerate(root.moves)}
+    for future in futures:
+        for spell_id, (visits, total) in future.result().items():
+            counts[spell_id][0] += visits
+            counts[spell_id][1] += total
+    # Most visited candidate, the better mean reward breaking ties
+    best_key = None
+    best_spell = None
+    for name in candidates:
+        visits, total = counts[spell_ids[name]]
+        key = (visits, total / visits if visits else 0.5)
+        if best_key is None or key > best_key:
+            best_key = key
             best_spell = name
-    return best_spell
+    return best_spell, best_key[1], tree.max_depth
+
+# Tree kept between MageBot's decisions (like the transposition table)
+mcts_tree = MctsTree()
+
+# ---- Endgame tablebase ----
+# Offline retrograde solve of the deterministic game (no effect procs), built by magebottb.py and
+# memory-mapped at runtime. States are stored from the point of view of the side to move, so one
+# table covers both sides. Resistance above the strongest attack blocks exactly like it, so it is
+# capped there. One byte per state: outcome in bits 4-5, best spell id in bits 0-3.
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "magebot.tb")
+TB_MAGIC = b"MBTB"
+TB_FORMAT_VERSION = 1
+TB_HEADER_FORMAT = "<4sH32sBBBB"  # magic, format version, signature, max hp, resistance levels, max mana, spell count
+TB_HEADER_SIZE = struct.calcsize(TB_HEADER_FORMAT)
+TB_DRAW, TB_WIN, TB_LOSS = range(3)  # outcome for the side to move
+TB_NO_MOVE = 15
+TB_RES_CAP = max((spell["damage"] for spell in attack_spells.values()), default=0)
+TB_RES_LEVELS = TB_RES_CAP + 1
+TB_MANA_LEVELS = MAX_MANA + 1
+TB_SIDE_STATES = MAX_HP * TB_RES_LEVELS * TB_MANA_LEVELS
+TB_STATES = TB_SIDE_STATES * TB_SIDE_STATES
+
+# Hash of everything the table depends on: a spell rebalance or a rule change gives a new signature
+def tablebase_signature():
+    rules = {"format": TB_FORMAT_VERSION, "max_hp": MAX_HP, "max_mana": MAX_MANA, "mana_regen": MANA_REGEN,
+             "spells": [[name, list(spell_table[spell_id])] for spell_id, name in enumerate(spell_names)]}
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode("utf-8")).digest()
+
+def tablebase_index(mover_hp, mover_res, mover_mana, opponent_hp, opponent_res, opponent_mana):
+    mover = ((mover_hp - 1) * TB_RES_LEVELS + min(mover_res, TB_RES_CAP)) * TB_MANA_LEVELS + mover_mana
+    opponent = ((opponent_hp - 1) * TB_RES_LEVELS + min(opponent_res, TB_RES_CAP)) * TB_MANA_LEVELS + opponent_mana
+    return mover * TB_SIDE_STATES + opponent
+
+class Tablebase:
+    def __init__(self, path=TABLEBASE_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, signature, max_hp, res_levels, max_mana, spell_count = struct.unpack_from(TB_HEADER_FORMAT, self._data, 0)
+            if magic != TB_MAGIC or version != TB_FORMAT_VERSION:
+                raise ValueError(f"{path} is not a MageBot tablebase (format {TB_FORMAT_VERSION})")
+            if signature != tablebase_signature() or (max_hp, res_levels, max_mana, spell_count) != (MAX_HP, TB_RES_LEVELS, MAX_MANA, len(spell_names)):
+                raise ValueError(f"{path} was built for another spell table, rebuild it with magebottb.py")
+            if len(self._data) != TB_HEADER_SIZE + TB_STATES:
+                raise ValueError(f"{path} is truncated")
+        except Exception:
+            self._data.close()
+            raise
+
+    def close(self):
+        self._data.close()
+
+    # (outcome, spell_id) for the side to move, spell_id None for a pass; None if the state is outside the table
+    def probe(self, state):
+        mover = state[TURN] * SIDE_SIZE
+        opponent = SIDE_SIZE - mover
+        if (state[FROZEN] or state[PARALYZED] or state[BURNED]
+                or state[SIDE_SIZE + FROZEN] or state[SIDE_SIZE + PARALYZED] or state[SIDE_SIZE + BURNED]):
+            return None
+        mover_hp, mover_res, mover_mana = state[mover + HP], state[mover + RES], state[mover + MANA]
+        opponent_hp, opponent_res, opponent_mana = state[opponent + HP], state[opponent + RES], state[opponent + MANA]
+        if not (0 < mover_hp <= MAX_HP and 0 < opponent_hp <= MAX_HP and 0 <= mover_mana <= MAX_MANA and 0 <= opponent_mana <= MAX_MANA
+                and mover_res >= 0 and opponent_res >= 0):
+            return None
+        entry = self._data[TB_HEADER_SIZE + tablebase_index(mover_hp, mover_res, mover_mana, opponent_hp, opponent_res, opponent_mana)]
+        spell_id = entry & 0x0F
+        return entry >> 4, (None if spell_id == TB_NO_MOVE else spell_id)
+
+# Loaded tablebase used by magebot_choose_spell (None: search only)
+tablebase = None
+
+# Maps the tablebase at `path` if it exists and matches the current spell table.
+# A stale or corrupt file is refused with a warning rather than silently used.
+def load_tablebase(path=TABLEBASE_PATH, quiet=False):
+    global tablebase
+    if tablebase is not None:
+        tablebase.close()
+        tablebase = None
+    if not os.path.exists(path):
+        return None
+    try:
+        tablebase = Tablebase(path)
+    except (OSError, ValueError, struct.error) as e:
+        if not quiet:
+            print(f"{Fore.YELLOW}[Tablebase] Not used: {e}{Style.RESET_ALL}")
+        return None
+    return tablebase
+
+# Decisive tablebase answer for MageBot, or None to fall back to search (outside the table, or a draw,
+# where every drawing move is equal for the table and the search heuristic is the better judge).
+# `wins_only`: a lost state is searched too (the table's longest defence ignores the effect procs that
+# are MageBot's way out of a deterministically lost position)
+def _tablebase_spell(state, possible_spells, wins_only=False):
+    if tablebase is None:
+        return None
+    entry = tablebase.probe(state)
+    if entry is None or entry[0] == TB_DRAW or entry[1] is None or (wins_only and entry[0] != TB_WIN):
+        return None
+    name = spell_names[entry[1]]
+    if possible_spells is not None and name not in possible_spells:
+        return None
+    return name
+
+# Spell choice by MageBot (the shared transposition table is reused between turns)
+# `state` is MageBot's turn with the burn tick already applied; returns a spell name. `weights` evaluates
+# the leaves instead of evaluation_weights (with a `table` of its own: cached scores depend on the weights).
+# Engines:
+#   "minimax"    full-width minimax at a fixed depth (reference engine, default without time_budget)
+#   "batch"      the same minimax search on NumPy arrays, much faster from depth 4 (needs numpy)
+#   "alphabeta"  alpha-beta with iterative deepening, as deep as time_budget allows (default with it)
+#   "expectimax" chance nodes for effect procs, bounded by EXPECTIMAX_NODE_BUDGET (and time_budget if given)
+#   "mcts"       Monte Carlo Tree Search, MCTS_ITERATIONS iterations (or time_budget), tree kept between
+#                turns; `depth` does not apply and `table` is not used
+# A loaded tablebase (opt-in, built by magebottb.py) answers first for every decided state it covers. It
+# only covers states without an effect counter on either side, and it is solved without effect procs:
+# expectimax only takes its won states and searches the rest, procs included. mcts does not consult it.
+MAGEBOT_ENGINES = ("minimax", "batch", "alphabeta", "expectimax", "mcts")
+MAGEBOT_ENGINE = "expectimax"  # engine used in the console duel
+
+def magebot_choose_spell(state, possible_spells=None, table=transposition_table, depth=None, time_budget=None, engine=None, weights=None):
+    if engine is None:
+        engine = "minimax" if time_budget is None else "alphabeta"
+    if engine not in MAGEBOT_ENGINES:
+        raise ValueError(f"Unknown MageBot engine: {engine}")
+    if weights is not None and table is transposition_table:
+        # The shared table holds scores under evaluation_weights: other weights search a table of their own
+        table = TranspositionTable()
+    if search_monitor is not None:
+        return search_monitor.decision(state, possible_spells, table, depth, time_budget, engine, weights)
+    return _choose_spell(state, possible_spells, table, depth, time_budget, engine, weights)[0]
+
+# Returns (spell, depth searched), the depth being None for a tablebase answer
+def _choose_spell(state, possible_spells, table, depth, time_budget, engine, weights=None):
+    if engine == "mcts":
+        # Same for the kept tree, whose rewards come from evaluation_weights
+        tree = None if weights is None else MctsTree()
+        best_spell, _, searched_depth = mcts_search(state, possible_spells, time_budget=time_budget, workers=MCTS_WORKERS,
+                                                    parallel=MCTS_PARALLEL, tree=tree, weights=weights)
+        return best_spell, searched_depth
+    name = _tablebase_spell(state, possible_spells, wins_only=engine == "expectimax")
+    if name is not None:
+        return name, None
+    if engine == "expectimax":
+        best_spell, _, searched_depth = expectimax_search(state, possible_spells, depth=EXPECTIMAX_DEPTH if depth is None else depth,
+                                                          time_budget=time_budget, table=table, weights=weights)
+        return best_spell, searched_depth
+    if engine == "alphabeta":
+        best_spell, _, searched_depth = iterative_deepening_search(state, possible_spells, time_budget=time_budget,
+                                                                   max_depth=MAGEBOT_MAX_DEPTH if depth is None else depth, table=table,
+                                                                   weights=weights)
+        return best_spell, searched_depth
+    if depth is None:
+        depth = MAGEBOT_SEARCH_DEPTH
+    if engine == "batch":
+        return batch_minimax_search(state, possible_spells, depth, weights)[0], depth
+    best_score = -float('inf')
+    best_spell = None
+    for name in _candidate_spells(state, possible_spells):
+        score = minimax(end_turn(apply_spell(state, spell_ids[name])), depth, table, weights)
+        if score > best_score:
+            best_score = score
+            best_spell = name
+    return best_spell, depth
+
+# ---- Pondering ----
+# Opt-in: while the player types, a background thread already searches MageBot's reply to every
+# position the player's move can lead to (each affordable spell, with and without its effect proc,
+# and a lost turn). The reply for the position actually reached is served as soon as it is ready.
+MAGEBOT_PONDER = False
+
+class Ponderer:
+    def __init__(self, engine=MAGEBOT_ENGINE, time_budget=MAGEBOT_TIME_BUDGET):
+        self.engine = engine
+        self.time_budget = time_budget
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="magebot-ponder")
+        self.futures = {}  # MageBot's position (burn tick applied) -> future of its spell
+        self.hits = 0
+        self.misses = 0
+
+    # MageBot positions reachable from the player's turn in `state`, most likely first
+    def _replies(self, state):
+        replies = [begin_turn(end_turn(state))]  # unknown spell or not enough mana: turn lost
+        outcomes = [spell_outcomes(state, spell_id) for spell_id in affordable_spell_ids(state)]
+        for rank in range(2):
+            for spell_outcome in outcomes:
+                if rank < len(spell_outcome):
+                    replies.append(begin_turn(spell_outcome[rank][1]))
+        return replies
+
+    # Called when the player is prompted in `state` (player's turn, not skipped)
+    def start(self, state):
+        self.cancel()
+        for reply in self._replies(state):
+            if reply in self.futures or duel_is_over(reply) or is_turn_skipped(reply):
+                continue
+            possible_spells = [spell_names[spell_id] for spell_id in affordable_spell_ids(reply)]
+            if possible_spells:
+                self.futures[reply] = self.executor.submit(self._search, reply, possible_spells)
+
+    # Runs in the ponder thread. Returns (spell, decision record), the record being None while the
+    # search monitor is off; the record is tagged as a ponder search.
+    def _search(self, state, possible_spells):
+        monitor = search_monitor
+        if monitor is None:
+            return magebot_choose_spell(state, possible_spells, engine=self.engine, time_budget=self.time_budget), None
+        name = monitor.decision(state, possible_spells, transposition_table, None, self.time_budget, self.engine, ponder=True)
+        return name, monitor.last
+
+    # MageBot's spell in `state`: the pondered one, or its own search on a miss
+    def choose(self, state, possible_spells):
+        started = time.perf_counter()
+        pondered = self.result(state)
+        if pondered is not None:
+            name, record = pondered
+            if search_monitor is not None and record is not None:
+                search_monitor.ponder_hit(record, time.perf_counter() - started)
+            return name
+        if search_monitor is not None:
+            return search_monitor.decision(state, possible_spells, transposition_table, None, self.time_budget, self.engine,
+                                           ponder_hit=False)
+        return magebot_choose_spell(state, possible_spells, engine=self.engine, time_budget=self.time_budget)
+
+    # Pondered (spell, decision record) for MageBot's position `state`, or None if it was not pondered.
+    # Every other search is dropped; the search still running is waited for, so the caller can
+    # search itself without sharing the transposition table with the ponder thread.
+    def result(self, state):
+        future = self.futures.pop(state, None)
+        pending = list(self.futures.values())
+        self.cancel()
+        if future is not None and not future.cancelled():
+            self.hits += 1
+            return future.result()
+        self.misses += 1
+        wait_futures(pending)
+        return None
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=True)
 
 async def activate_magebot_ai(): # Activates an LLM and not a simulation. (To be updated in future versions)
     print("MageBot AI: activated.")
     await asyncio.sleep(1)  # Simulate an asynchronous operation
 
-# Merge all spells into a single dictionary
-all_spells = {}
-all_spells.update(attack_spells)
-all_spells.update(resistance_spells)
-all_spells.update(healing_spells)
-
-def print_spells_ui():
-    print("\n=== Available Spells ===")
-    print("\n[Attack Spells]")
+def format_spells():
+    lines = ["\n=== Available Spells ===", "\n[Attack Spells]"]
     for name, spell in attack_spells.items():
         effect_str = ""
         if "effect" in spell:
             effect_str = f" | Effect: {spell['effect']} ({spell['chance']*100:.0f}% chance, {spell['duration']} turn(s))"
-        print(f"  {name} : {spell['description']} (Damage : {spell['damage']}, Mana : {spell['mana_cost']}){effect_str}")
-    print("\n[Healing Spells]")
+        lines.append(f"  {name} : {spell['description']} (Damage : {spell['damage']}, Mana : {spell['mana_cost']}){effect_str}")
+    lines.append("\n[Healing Spells]")
     for name, spell in healing_spells.items():
-        print(f"  {name} : {spell['description']} (Healing : {spell['healing']}, Mana : {spell['mana_cost']})")
-    print("\n[Resistance Spells]")
+        lines.append(f"  {name} : {spell['description']} (Healing : {spell['healing']}, Mana : {spell['mana_cost']})")
+    lines.append("\n[Resistance Spells]")
     for name, spell in resistance_spells.items():
-        print(f"  {name} : {spell['description']} (Resistance : +{spell['resistance_boost']}, Mana : {spell['mana_cost']})")
-    print("========================\n")
+        lines.append(f"  {name} : {spell['description']} (Resistance : +{spell['resistance_boost']}, Mana : {spell['mana_cost']})")
+    lines.append("========================\n")
+    return "\n".join(lines)
 
-async def duel_vs_magebot():
-    await activate_magebot_ai()
-    print("The duel begins!")
-    player_hp = 10
-    player_res = 5
-    player_mana = 15
-    player_max_hp = 20
-    player_max_mana = 25
-    magebot_hp = 10
-    magebot_res = 5
-    magebot_mana = 15
-    magebot_max_hp = 20
-    magebot_max_mana = 25
-    player_effects = {"frozen": 0, "paralyzed": 0, "burned": 0}
-    magebot_effects = {"frozen": 0, "paralyzed": 0, "burned": 0}
-
-    while player_hp > 0 and magebot_hp > 0:
-        print_duel_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, player_effects, magebot_effects)
-        print_spells_ui()
-        print(f"{Fore.CYAN}=== Your Turn ==={Style.RESET_ALL}")
+# ---- Duel event log ----
+# Every turn event is a small record (kind, side, a, b) sent to pluggable sinks instead of being printed:
+# the buffered colored terminal renderer, nothing at all (NullSink, headless runs), or a replay file
+# that, with the RNG seed, lets magebotreplay.py re-simulate the duel exactly.
+EV_TURN, EV_BURN, EV_SKIP, EV_CAST, EV_DAMAGE, EV_HEAL, EV_RESIST, EV_EFFECT, EV_REGEN, EV_INVALID, EV_PASS, EV_END = range(12)
+EVENT_NAMES = ("turn", "burn", "skip", "cast", "damage", "heal", "resist", "effect", "regen", "invalid", "pass", "end")
+# Fields per kind:
+#   turn (side, turn number)                 burn (side, damage)             skip (side, effect counter)
+#   cast (side, spell id)                    damage (target, damage, resistance broken)
+#   heal (side, HP restored, max HP reached) resist (side, resistance)       effect (target, effect counter, duration)
+#   regen (side, mana recovered, mana)       invalid (side, spell id or -1 for an unknown spell: turn lost)
+#   pass (side: nothing to cast)             end (winner, NO_WINNER for an undecided duel)
+DuelEvent = namedtuple("DuelEvent", ["kind", "side", "a", "b"])
+_new_tuple = tuple.__new__
+NO_WINNER = 2  # side of the "end" event of a duel stopped undecided (max_turns)
 
-        # Apply player effects
-        if player_effects["burned"] > 0:
-            burn_damage = 1
-            player_hp -= burn_damage
-            print(f"{Fore.RED}[Burn] You take {burn_damage} burn damage!{Style.RESET_ALL}")
-            player_effects["burned"] -= 1
-        if player_effects["frozen"] > 0 or player_effects["paralyzed"] > 0:
-            effect_name = "frozen" if player_effects["frozen"] > 0 else "paralyzed"
-            print(f"{Fore.BLUE}[Effect] You are {effect_name} and skip your turn!{Style.RESET_ALL}")
-            player_effects["frozen"] = max(0, player_effects["frozen"] - 1)
-            player_effects["paralyzed"] = max(0, player_effects["paralyzed"] - 1)
-            # Skip to mana regen
-        else:
-            action = input("Your turn! Type a spell name: ").strip()
-            if action in all_spells:
-                spell = all_spells[action]
-                mana_cost = spell.get("mana_cost", 0)
-                if player_mana < mana_cost:
-                    print(f"{Fore.RED}[Error] Not enough mana to cast {action}! Required mana: {mana_cost}, Current mana: {player_mana}{Style.RESET_ALL}")
-                else:
-                    player_mana -= mana_cost
-                    if "damage" in spell:
-                        # Special message if enemy resistance is broken
-                        if magebot_res > 0 and spell["damage"] >= magebot_res:
-                            print(f"{Fore.YELLOW}[Info] Enemy resistance broken! (RES:0){Style.RESET_ALL}")
-                        dmg = max(0, spell["damage"] - magebot_res)
-                        magebot_hp -= dmg
-                        print_action_log("You", action, spell, dmg, "MageBot")
-                        magebot_res = 0
-                        # Apply effect if present
-                        if "effect" in spell and random.random() < spell["chance"]:
-                            magebot_effects[spell["effect"]] = spell["duration"]
-                            print(f"{Fore.YELLOW}[Effect] MageBot is now {spell['effect']} for {spell['duration']} turn(s)!{Style.RESET_ALL}")
-                    elif "healing" in spell:
-                        player_hp += spell["healing"]
-                        if player_hp > player_max_hp:
-                            player_hp = player_max_hp
-                            print(f"{Fore.GREEN}[Info] You have reached your maximum HP!{Style.RESET_ALL}")
-                        print_action_log("You", action, spell, spell["healing"], "You")
-                    elif "resistance_boost" in spell:
-                        player_res += spell["resistance_boost"]
-                        print_action_log("You", action, spell, spell["resistance_boost"], "You")
+# Hash of the rules and spell table a recorded duel was played with (spell ids follow spells.json)
+def rules_signature():
+    rules = {"max_hp": MAX_HP, "max_mana": MAX_MANA, "mana_regen": MANA_REGEN, "burn_damage": BURN_DAMAGE,
+             "spells": [[name, list(spell_table[spell_id])] for spell_id, name in enumerate(spell_names)]}
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode("utf-8")).digest()
+
+class DuelLog:
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+
+    # Start of a duel: its RNG seed and initial state
+    def begin(self, seed, state):
+        for sink in self.sinks:
+            sink.begin(seed, state)
+
+    # `state` is the state right after the event. Hot in simulations: the event tuple is built
+    # without the namedtuple constructor's argument handling.
+    def emit(self, kind, side, a=0, b=0, state=None):
+        if self.sinks:
+            event = _new_tuple(DuelEvent, (kind, side, a, b))
+            for sink in self.sinks:
+                sink.event(event, state)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+# No-op sink, and the base class of the others
+class NullSink:
+    def begin(self, seed, state):
+        pass
+
+    def event(self, event, state):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+# Colored duel messages, written in one go at every flush (before the player is prompted and between turns)
+class TerminalSink(NullSink):
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.lines = []
+        self.spell_id = None  # spell of the last cast, for the damage/heal/resist lines
+
+    def event(self, event, state):
+        kind, side, a, b = event
+        you = side == PLAYER
+        out = self.lines.append
+        if kind == EV_TURN:
+            if you:
+                out(format_duel_state(state))
+                out(format_spells())
+                out(f"{Fore.CYAN}=== Your Turn ==={Style.RESET_ALL}")
+            else:
+                out(f"{Fore.MAGENTA}=== MageBot's Turn ==={Style.RESET_ALL}")
+        elif kind == EV_BURN:
+            out(f"{Fore.RED}[Burn] {'You take' if you else 'MageBot takes'} {a} burn damage!{Style.RESET_ALL}")
+        elif kind == EV_SKIP:
+            out(f"{Fore.BLUE}[Effect] {'You are' if you else 'MageBot is'} {EFFECT_LABELS[a]} and {'skip your' if you else 'skips its'} turn!{Style.RESET_ALL}")
+        elif kind == EV_CAST:
+            self.spell_id = a
+            if not you:
+                # MageBot no longer has random comments, everything is deterministic
+                out(f"{Fore.MAGENTA}[MageBot] MageBot acts deterministically.{Style.RESET_ALL}")
+        elif kind == EV_DAMAGE:
+            # Special message if the target's resistance is broken
+            if b:
+                out(f"{Fore.YELLOW}[Info] {'Your resistance is' if you else 'Enemy resistance'} broken! (RES:0){Style.RESET_ALL}")
+            name = spell_names[self.spell_id]
+            out(format_action_log("MageBot" if you else "You", name, all_spells[name], a, "You" if you else "MageBot"))
+        elif kind == EV_EFFECT:
+            out(f"{Fore.YELLOW}[Effect] {'You are' if you else 'MageBot is'} now {EFFECT_LABELS[a]} for {b} turn(s)!{Style.RESET_ALL}")
+        elif kind == EV_HEAL or kind == EV_RESIST:
+            if kind == EV_HEAL and b:
+                out(f"{Fore.GREEN}[Info] {'You have' if you else 'MageBot has'} reached {'your' if you else 'its'} maximum HP!{Style.RESET_ALL}")
+            name = spell_names[self.spell_id]
+            actor = "You" if you else "MageBot"
+            out(format_action_log(actor, name, all_spells[name], spell_values[self.spell_id], actor))
+        elif kind == EV_REGEN:
+            color = Fore.BLUE if you else Fore.MAGENTA
+            out(f"{color}[Mana] {'You recover' if you else 'MageBot recovers'} {a} mana. (Mana: {b}/{MAX_MANA}){Style.RESET_ALL}")
+        elif kind == EV_INVALID:
+            if a < 0:
+                out(f"{Fore.RED}Unknown spell. Turn lost.{Style.RESET_ALL}")
+            else:
+                mana = state.player_mana if you else state.magebot_mana
+                out(f"{Fore.RED}[Error] Not enough mana to cast {spell_names[a]}! Required mana: {spell_costs[a]}, Current mana: {mana}{Style.RESET_ALL}")
+        elif kind == EV_PASS:
+            if you:
+                out(f"{Fore.BLUE}You don't have enough mana to cast a spell! You pass your turn...{Style.RESET_ALL}")
+            else:
+                out(f"{Fore.MAGENTA}MageBot doesn't have enough mana to cast a spell! It passes its turn...{Style.RESET_ALL}")
+        elif kind == EV_END:
+            out(format_duel_state(state))
+            if side == PLAYER:
+                out(f"{Fore.GREEN}Congratulations, you defeated MageBot!{Style.RESET_ALL}")
+            elif side == NO_WINNER:
+                out(f"{Fore.YELLOW}The duel ends in a draw.{Style.RESET_ALL}")
             else:
-                print(f"{Fore.RED}Unknown spell. Turn lost.{Style.RESET_ALL}")
+                out(f"{Fore.RED}You lost against MageBot...{Style.RESET_ALL}")
+
+    def flush(self):
+        if self.lines:
+            self.stream.write("\n".join(self.lines) + "\n")
+            self.stream.flush()
+            self.lines.clear()
+
+# Replay files: a header (format, seed, initial state, rules signature) then the events, either
+# packed (6 bytes per event) or as JSON lines for reading by eye. Buffered, flushed with the log.
+REPLAY_MAGIC = b"MBRP"
+REPLAY_VERSION = 1
+REPLAY_HEADER_FORMAT = "<4sHQ32s13b"  # magic, version, seed, rules signature, initial state
+REPLAY_HEADER_SIZE = struct.calcsize(REPLAY_HEADER_FORMAT)
+REPLAY_EVENT = struct.Struct("<BBhh")  # kind, side, a, b
+REPLAY_JSONL_FORMAT = "magebot-replay"
+
+class BinaryReplaySink(NullSink):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+
+    def begin(self, seed, state):
+        self.file.write(struct.pack(REPLAY_HEADER_FORMAT, REPLAY_MAGIC, REPLAY_VERSION, seed, rules_signature(), *state))
+
+    def event(self, event, state):
+        self.file.write(REPLAY_EVENT.pack(*event))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JsonlReplaySink(BinaryReplaySink):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+
+    def begin(self, seed, state):
+        self.file.write(json.dumps({"format": REPLAY_JSONL_FORMAT, "version": REPLAY_VERSION, "seed": seed, "state": list(state),
+                                    "signature": rules_signature().hex(), "spells": spell_names}) + "\n")
+
+    def event(self, event, state):
+        self.file.write(json.dumps([EVENT_NAMES[event.kind], event.side, event.a, event.b]) + "\n")
+
+# Integer RNG seed (what a replay file stores) for any seed value: other values are hashed
+def duel_seed(seed):
+    if isinstance(seed, int) and 0 <= seed < 1 << 64:
+        return seed
+    return int.from_bytes(hashlib.sha256(str(seed).encode("utf-8")).digest()[:8], "little")
+
+# .jsonl files are written as JSON lines, anything else in the packed format
+def open_replay_sink(path):
+    return JsonlReplaySink(path) if path.endswith(".jsonl") else BinaryReplaySink(path)
+
+# Returns (header, events) of a replay file of either format; header holds seed, state and signature
+def read_replay(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(REPLAY_MAGIC)] == REPLAY_MAGIC:
+        magic, version, seed, signature, *state = struct.unpack_from(REPLAY_HEADER_FORMAT, data, 0)
+        if version != REPLAY_VERSION:
+            raise ValueError(f"{path}: unsupported replay version {version}")
+        body = data[REPLAY_HEADER_SIZE:]
+        body = body[:len(body) - len(body) % REPLAY_EVENT.size]  # a crash can leave a partial event
+        events = [DuelEvent(*fields) for fields in REPLAY_EVENT.iter_unpack(body)]
+    else:
+        lines = data.decode("utf-8").splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("format") != REPLAY_JSONL_FORMAT or header.get("version") != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a MageBot replay (version {REPLAY_VERSION})")
+        seed, state, signature = header["seed"], header["state"], bytes.fromhex(header["signature"])
+        events = []
+        for line in lines[1:]:
+            try:
+                name, side, a, b = json.loads(line)
+            except ValueError:
+                break  # partial last line
+            events.append(DuelEvent(EVENT_NAMES.index(name), side, a, b))
+    return {"seed": seed, "state": DuelState(*state), "signature": signature}, events
+
+# ---- Duel turns ----
+# Burn tick and freeze/paralyze check at the start of a turn.
+# Returns (state, skipped); a skipped turn has already had its effect counters decremented.
+def log_turn_start(state, log):
+    side = state.turn
+    new_state = begin_turn(state)
+    if new_state is not state:
+        log.emit(EV_BURN, side, BURN_DAMAGE, state=new_state)
+    if is_turn_skipped(new_state):
+        counter = FROZEN if new_state[side * SIDE_SIZE + FROZEN] > 0 else PARALYZED
+        new_state = skip_turn(new_state)
+        log.emit(EV_SKIP, side, counter, state=new_state)
+        return new_state, True
+    return new_state, False
+
+# The side to move casts spell_id (mana already checked), rolling the spell's effect chance with `rng`
+def log_cast(state, spell_id, rng, log):
+    side = state.turn
+    kind, value, cost, effect, duration, chance = spell_table[spell_id]
+    caster = side * SIDE_SIZE
+    target_res = state[SIDE_SIZE - caster + RES]
+    proc = effect is not None and rng.random() < chance
+    new_state = apply_spell(state, spell_id, proc)
+    log.emit(EV_CAST, side, spell_id, state=new_state)
+    if kind == ATTACK:
+        log.emit(EV_DAMAGE, 1 - side, max(0, value - target_res), int(target_res > 0 and value >= target_res), new_state)
+        if proc:
+            log.emit(EV_EFFECT, 1 - side, effect, duration, new_state)
+    elif kind == HEALING:
+        log.emit(EV_HEAL, side, new_state[caster + HP] - state[caster + HP], int(state[caster + HP] + value > MAX_HP), new_state)
+    else:
+        log.emit(EV_RESIST, side, value, state=new_state)
+    return new_state
+
+# Mana regeneration of the side that just played, then hand the turn over
+def log_turn_end(state, log):
+    new_state = end_turn(state)
+    mana = state[state.turn * SIDE_SIZE + MANA]
+    if mana < MAX_MANA:
+        new_mana = new_state[state.turn * SIDE_SIZE + MANA]
+        log.emit(EV_REGEN, state.turn, new_mana - mana, new_mana, new_state)
+    return new_state
+
+def duel_is_over(state):
+    return state.player_hp <= 0 or state.magebot_hp <= 0
+
+# Checks and casts `name` for the side to move: None passes (nothing to cast), an unknown or
+# unaffordable spell loses the turn
+def log_move(state, name, rng, log):
+    side = state.turn
+    if name is None:
+        log.emit(EV_PASS, side, state=state)
+        return state
+    spell_id = spell_ids.get(name)
+    if spell_id is None:
+        log.emit(EV_INVALID, side, -1, state=state)
+    elif spell_costs[spell_id] > state[side * SIDE_SIZE + MANA]:
+        log.emit(EV_INVALID, side, spell_id, state=state)
+    else:
+        state = log_cast(state, spell_id, rng, log)
+    return state
+
+# The one duel loop of every front end (console, replays, duel server, simulations). Plays from `state`,
+# player first, and returns the final state. player_move(state) returns the player's spell name (see
+# log_move), magebot_move(state, possible_spells) MageBot's and is only asked when MageBot can afford a
+# spell; both may be coroutine functions. `pause` (a coroutine function) is awaited before each MageBot
+# turn. After `max_turns` turns (each side's turn counting for one) the duel stops undecided.
+async def run_duel(state, rng, log, player_move, magebot_move, pause=None, max_turns=None):
+    turn_number = 0
+    turns = 0
+    while not duel_is_over(state):
+        if max_turns is not None and turns >= max_turns:
+            break
+        turns += 1
+        turn_number += 1
+        log.emit(EV_TURN, PLAYER, turn_number, state=state)
+
+        # Apply player effects
+        state, skipped = log_turn_start(state, log)
+        if duel_is_over(state):
+            break
+        if not skipped:
+            log.flush()
+            name = player_move(state)
+            if name is not None and not isinstance(name, str):
+                name = await name  # coroutine function
+            state = log_move(state, name, rng, log)
 
         # Player mana regeneration
-        regen = 2
-        if player_mana < player_max_mana:
-            player_mana += regen
-            if player_mana > player_max_mana:
-                player_mana = player_max_mana
-            print(f"{Fore.BLUE}[Mana] You recover {regen} mana. (Mana: {player_mana}/{player_max_mana}){Style.RESET_ALL}")
-
-        if magebot_hp <= 0:
-            print_duel_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, player_effects, magebot_effects)
-            print(f"{Fore.GREEN}Congratulations, you defeated MageBot!{Style.RESET_ALL}")
+        state = log_turn_end(state, log)
+        if duel_is_over(state) or (max_turns is not None and turns >= max_turns):
             break
+        turns += 1
 
-        # MageBot plays with Minimax
-        await asyncio.sleep(1)
-        print(f"{Fore.MAGENTA}=== MageBot's Turn ==={Style.RESET_ALL}")
+        # MageBot plays with its search engine
+        log.flush()
+        if pause is not None:
+            await pause()
+        log.emit(EV_TURN, MAGEBOT, turn_number, state=state)
 
         # Apply magebot effects
-        if magebot_effects["burned"] > 0:
-            burn_damage = 1
-            magebot_hp -= burn_damage
-            print(f"{Fore.RED}[Burn] MageBot takes {burn_damage} burn damage!{Style.RESET_ALL}")
-            magebot_effects["burned"] -= 1
-        if magebot_effects["frozen"] > 0 or magebot_effects["paralyzed"] > 0:
-            effect_name = "frozen" if magebot_effects["frozen"] > 0 else "paralyzed"
-            print(f"{Fore.BLUE}[Effect] MageBot is {effect_name} and skips its turn!{Style.RESET_ALL}")
-            magebot_effects["frozen"] = max(0, magebot_effects["frozen"] - 1)
-            magebot_effects["paralyzed"] = max(0, magebot_effects["paralyzed"] - 1)
-            # Skip to mana regen
-        else:
+        state, skipped = log_turn_start(state, log)
+        if duel_is_over(state):
+            break
+        if not skipped:
             # MageBot chooses a spell it can afford
-            magebot_possible_spells = [name for name, s in all_spells.items() if s.get("mana_cost", 0) <= magebot_mana]
-            if not magebot_possible_spells:
-                print(f"{Fore.MAGENTA}MageBot doesn't have enough mana to cast a spell! It passes its turn...{Style.RESET_ALL}")
-                magebot_mana += 2
-                if magebot_mana > magebot_max_mana:
-                    magebot_mana = magebot_max_mana
-                print(f"{Fore.MAGENTA}[Mana] MageBot recovers 2 mana. (Mana: {magebot_mana}/{magebot_max_mana}){Style.RESET_ALL}")
-            else:
-                magebot_action = magebot_choose_spell(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, magebot_max_hp, magebot_possible_spells)
-                spell = all_spells[magebot_action]
-                mana_cost = spell.get("mana_cost", 0)
-                magebot_mana -= mana_cost
-                # MageBot dialogue
-                # MageBot no longer has random comments, everything is deterministic
-                print(f"{Fore.MAGENTA}[MageBot] MageBot acts deterministically.{Style.RESET_ALL}")
-                if "damage" in spell:
-                    if player_res > 0 and spell["damage"] >= player_res:
-                        print(f"{Fore.YELLOW}[Info] Your resistance is broken! (RES:0){Style.RESET_ALL}")
-                    dmg = max(0, spell["damage"] - player_res)
-                    player_hp -= dmg
-                    print_action_log("MageBot", magebot_action, spell, dmg, "You")
-                    player_res = 0
-                    # Apply effect if present
-                    if "effect" in spell and random.random() < spell["chance"]:
-                        player_effects[spell["effect"]] = spell["duration"]
-                        print(f"{Fore.YELLOW}[Effect] You are now {spell['effect']} for {spell['duration']} turn(s)!{Style.RESET_ALL}")
-                elif "healing" in spell:
-                    magebot_hp += spell["healing"]
-                    if magebot_hp > magebot_max_hp:
-                        magebot_hp = magebot_max_hp
-                        print(f"{Fore.GREEN}[Info] MageBot has reached its maximum HP!{Style.RESET_ALL}")
-                    print_action_log("MageBot", magebot_action, spell, spell["healing"], "MageBot")
-                elif "resistance_boost" in spell:
-                    magebot_res += spell["resistance_boost"]
-                    print_action_log("MageBot", magebot_action, spell, spell["resistance_boost"], "MageBot")
+            magebot_possible_spells = [spell_names[spell_id] for spell_id in affordable_spell_ids(state)]
+            name = None
+            if magebot_possible_spells:
+                name = magebot_move(state, magebot_possible_spells)
+                if name is not None and not isinstance(name, str):
+                    name = await name
+            state = log_move(state, name, rng, log)
 
         # MageBot mana regeneration
-        if magebot_mana < magebot_max_mana:
-            magebot_mana += regen
-            if magebot_mana > magebot_max_mana:
-                magebot_mana = magebot_max_mana
-            print(f"{Fore.MAGENTA}[Mana] MageBot recovers {regen} mana. (Mana: {magebot_mana}/{magebot_max_mana}){Style.RESET_ALL}")
-
-        if player_hp <= 0:
-            print_duel_state(player_hp, player_res, player_mana, magebot_hp, magebot_res, magebot_mana, player_effects, magebot_effects)
-            print(f"{Fore.RED}You lost against MageBot...{Style.RESET_ALL}")
-            break
+        state = log_turn_end(state, log)
+
+    if state.magebot_hp <= 0:
+        winner = PLAYER
+    elif state.player_hp <= 0:
+        winner = MAGEBOT
+    else:
+        winner = NO_WINNER
+    log.emit(EV_END, winner, state=state)
+    log.flush()
+    return state
+
+# Runs run_duel without an event loop, for headless callers whose moves never await (simulations)
+def run_duel_sync(state, rng, log, player_move, magebot_move, max_turns=None):
+    duel = run_duel(state, rng, log, player_move, magebot_move, max_turns=max_turns)
+    try:
+        duel.send(None)
+    except StopIteration as done:
+        return done.value
+    duel.close()
+    raise RuntimeError("run_duel_sync: a move awaited, use run_duel")
+
+# `profile`: path of a cProfile dump covering the whole duel (turn loop, searches, display)
+# `record`: directory receiving a replay file of the duel, `record_format` "binary" or "jsonl"
+async def duel_vs_magebot(ponder=None, profile=None, record=None, record_format="binary", seed=None):
+    await activate_magebot_ai()
+    print("The duel begins!")
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    state = new_duel_state()
+    log = DuelLog([TerminalSink()])
+    if record:
+        os.makedirs(record, exist_ok=True)
+        extension = "jsonl" if record_format == "jsonl" else "mbr"
+        log.sinks.append(open_replay_sink(os.path.join(record, f"duel-{time.strftime('%Y%m%d-%H%M%S')}-{seed:x}.{extension}")))
+    log.begin(seed, state)
+    ponderer = Ponderer(MAGEBOT_ENGINE) if (MAGEBOT_PONDER if ponder is None else ponder) else None
+
+    def player_move(state):
+        if ponderer is not None:
+            ponderer.start(state)
+        return input("Your turn! Type a spell name: ").strip()
+
+    def magebot_move(state, possible_spells):
+        if ponderer is not None:
+            return ponderer.choose(state, possible_spells)
+        return magebot_choose_spell(state, possible_spells, engine=MAGEBOT_ENGINE, time_budget=MAGEBOT_TIME_BUDGET)
+
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        await run_duel(state, random.Random(seed), log, player_move, magebot_move, pause=lambda: asyncio.sleep(1))
+    finally:
+        log.close()
+        if profiler is not None:
+            save_profile(profiler, profile)
+        if ponderer is not None:
+            ponderer.close()
 
 # Duel startup function
 
-def main():
+def main(argv=None):
+    global MAGEBOT_ENGINE, MCTS_WORKERS, MCTS_PARALLEL
+    parser = argparse.ArgumentParser(description="MageBot CLI")
+    parser.add_argument("--ponder", action="store_true", help="let MageBot think during your turn")
+    parser.add_argument("--search-log", metavar="FILE", help="append one JSON line per MageBot decision (nodes, cutoffs, cache hits, time)")
+    parser.add_argument("--metrics", metavar="FILE", help="write Prometheus counters of MageBot's searches to FILE on exit")
+    parser.add_argument("--profile", metavar="FILE", help="cProfile each duel and write the stats to FILE")
+    parser.add_argument("--engine", choices=MAGEBOT_ENGINES, default=MAGEBOT_ENGINE, help="MageBot's search engine")
+    parser.add_argument("--mcts-workers", type=int, default=MCTS_WORKERS, metavar="N", help="processes running the mcts rollouts")
+    parser.add_argument("--mcts-parallel", choices=MCTS_PARALLEL_MODES, default=MCTS_PARALLEL, help="root- or leaf-parallel mcts rollouts")
+    parser.add_argument("--record", metavar="DIR", help="write a replay file of each duel to DIR (see magebotreplay.py)")
+    parser.add_argument("--record-format", choices=("binary", "jsonl"), default="binary")
+    parser.add_argument("--seed", type=int, help="seed of the spell effect rolls (default: a random seed per duel)")
+    args = parser.parse_args(argv)
+    if args.seed is not None and not 0 <= args.seed < 1 << 64:
+        parser.error("--seed must be between 0 and 2**64 - 1")
+    MAGEBOT_ENGINE, MCTS_WORKERS, MCTS_PARALLEL = args.engine, args.mcts_workers, args.mcts_parallel
+    sinks = []
+    if args.search_log:
+        sinks.append(JsonlSink(args.search_log))
+    if args.metrics:
+        sinks.append(PrometheusSink(args.metrics))
+    if sinks:
+        enable_search_monitor(*sinks)
     try:
-        asyncio.run(init())
+        asyncio.run(init(ponder=args.ponder or MAGEBOT_PONDER, profile=args.profile,
+                         record=args.record, record_format=args.record_format, seed=args.seed))
     except KeyboardInterrupt:
         print("\nClosing MageBot CLI.")
+    finally:
+        disable_search_monitor()
+        close_mcts_pool()
 
-async def init():
+async def init(ponder=MAGEBOT_PONDER, profile=None, record=None, record_format="binary", seed=None):
     print(f"{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
     print(f"{Fore.CYAN}███╗   ███╗ █████╗  ██████╗ ███████╗    ██████╗  ██████╗ ████████╗{Style.RESET_ALL}")
     print(f"{Fore.CYAN}████╗ ████║██╔══██╗██╔════╝ ██╔════╝    ██╔══██╗██╔═══██╗╚══██╔══╝{Style.RESET_ALL}")
@@ -350,6 +1958,8 @@ async def init():
     print(f"{Fore.CYAN}Welcome to MageBot CLI{Style.RESET_ALL}")
     print("Type 'help' to see available commands.")
     print(f'Version: 1.1.7')
+    load_tablebase()
+    load_evaluation_weights()
     while True:
         print(f"{Fore.YELLOW}{'='*40}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}MageBot CLI - Main Menu{Style.RESET_ALL}")
@@ -371,7 +1981,7 @@ async def init():
             print(f"{Fore.YELLOW}Starting duel mode...{Style.RESET_ALL}")
             await asyncio.sleep(2)
             print(f"{Fore.YELLOW}You are about to face MageBot AI! Prepare for battle!{Style.RESET_ALL}")
-            await duel_vs_magebot()
+            await duel_vs_magebot(ponder, profile, record, record_format, seed)
         elif command == "4" or command.lower() == "exit":
             print(f"{Fore.YELLOW}Closing MageBot CLI.{Style.RESET_ALL}")
             break
@@ -0,0 +1,160 @@
+# MageBot Replay - Replays and verifies recorded duels
+# Notes: A replay file (magebotcli.py --record DIR) holds the duel's RNG seed, its initial state and
+# every turn event. The duel is re-simulated from the recorded decisions with the same seed, through
+# the same turn loop as the CLI, and every regenerated event is checked against the recording: the
+# first difference (a rule change, a spell rebalance, a nondeterminism bug) is reported with its turn.
+# --search ENGINE lets the current AI choose MageBot's moves instead, to see how it would have played
+# the recorded player moves; the events are then not verified.
+#
+# Usage: python console/magebotreplay.py replays/duel-20260101-120000-1f.mbr --from-turn 5
+#        python console/magebotreplay.py replays/*.mbr --quiet
+
+# Import necessary modules
+import argparse
+import asyncio
+import random
+import sys
+
+from magebotcli import (
+    EV_CAST, EV_END, EV_INVALID, EV_PASS, EV_TURN, EVENT_NAMES, MAGEBOT, MAGEBOT_ENGINES, NO_WINNER, PLAYER, DuelLog, NullSink,
+    TerminalSink, load_evaluation_weights, load_tablebase, magebot_choose_spell, read_replay, rules_signature,
+    run_duel, spell_names,
+)
+
+SIDE_NAMES = ("player", "magebot", "draw")
+
+
+class ReplayEnd(Exception):
+    pass
+
+
+class ReplayDivergence(Exception):
+    pass
+
+
+# Recorded decisions per side, in order: spell names, "" for an unknown spell (turn lost), None for a
+# player's pass (simulations; MageBot's passes are not decisions, it is never asked without mana)
+def recorded_decisions(events):
+    decisions = ([], [])
+    for event in events:
+        if event.kind == EV_CAST or event.kind == EV_INVALID:
+            decisions[event.side].append(spell_names[event.a] if event.a >= 0 else "")
+        elif event.kind == EV_PASS and event.side == PLAYER:
+            decisions[PLAYER].append(None)
+    return decisions
+
+# Turn limit of a duel recorded as undecided (simulations stop at max_turns), None otherwise
+def recorded_max_turns(events):
+    if events and events[-1].kind == EV_END and events[-1].side == NO_WINNER:
+        return sum(event.kind == EV_TURN for event in events)
+    return None
+
+def format_event(event):
+    text = f"{EVENT_NAMES[event.kind]} {SIDE_NAMES[event.side]}"
+    if event.kind == EV_CAST or (event.kind == EV_INVALID and event.a >= 0):
+        return f"{text} {spell_names[event.a]}"
+    return f"{text} {event.a} {event.b}"
+
+# Checks every event against the recording; stops the duel at the first difference
+class VerifySink(NullSink):
+    def __init__(self, recorded):
+        self.recorded = recorded
+        self.index = 0
+        self.turn = 0
+
+    def event(self, event, state):
+        if event.kind == EV_TURN:
+            self.turn = event.a
+        if self.index >= len(self.recorded):
+            raise ReplayEnd(f"the recording ends at event {self.index} (turn {self.turn})")
+        expected = self.recorded[self.index]
+        if event != expected:
+            raise ReplayDivergence(f"event {self.index} (turn {self.turn}): recorded '{format_event(expected)}', "
+                                   f"replayed '{format_event(event)}'")
+        self.index += 1
+
+# Terminal output from turn `from_turn` on, the earlier turns are fast-forwarded silently
+class FromTurnSink(TerminalSink):
+    def __init__(self, from_turn=1, stream=None):
+        super().__init__(stream)
+        self.from_turn = from_turn
+        self.active = from_turn <= 1
+
+    def event(self, event, state):
+        if not self.active and (event.kind == EV_TURN and event.a >= self.from_turn or event.kind == EV_END):
+            self.active = True
+        if self.active:
+            super().event(event, state)
+
+# Replays `path`. Returns (ok, message); `ok` is False on a divergence or a truncated recording.
+def replay(path, quiet=False, from_turn=1, search=None, delay=0.0):
+    header, events = read_replay(path)
+    if header["signature"] != rules_signature():
+        print(f"[Replay] {path} was recorded with other rules or spells, expect a divergence", file=sys.stderr)
+    decisions = [iter(side) for side in recorded_decisions(events)]
+    sinks = [] if quiet else [FromTurnSink(from_turn)]
+    verify = VerifySink(events)
+    if search is None:
+        sinks.append(verify)
+    log = DuelLog(sinks)
+    magebot_changes = []
+
+    def next_decision(side):
+        try:
+            return next(decisions[side])
+        except StopIteration:
+            raise ReplayEnd(f"the recording has no more {SIDE_NAMES[side]} moves") from None
+
+    def player_move(state):
+        return next_decision(PLAYER)
+
+    def magebot_move(state, possible_spells):
+        if search is None:
+            return next_decision(MAGEBOT)
+        action = magebot_choose_spell(state, possible_spells, engine=search)
+        recorded = next(decisions[MAGEBOT], None)
+        if recorded is not None and recorded != action:
+            magebot_changes.append((recorded, action))
+        return action
+
+    pause = (lambda: asyncio.sleep(delay)) if delay > 0 else None
+    try:
+        state = asyncio.run(run_duel(header["state"], random.Random(header["seed"]), log, player_move, magebot_move, pause,
+                                     recorded_max_turns(events)))
+    except ReplayEnd as end:
+        log.flush()
+        return False, f"truncated: {end}"
+    except ReplayDivergence as divergence:
+        log.flush()
+        return False, f"diverges at {divergence}"
+    winner = "player" if state.magebot_hp <= 0 else "magebot" if state.player_hp <= 0 else "nobody"
+    if search is not None:
+        return True, f"{winner} wins with {search} playing MageBot ({len(magebot_changes)} MageBot moves changed)"
+    if verify.index < len(events):
+        return False, f"diverges at event {verify.index}: the duel ends but the recording goes on"
+    return True, f"matches the recording ({len(events)} events, {winner} wins)"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay and verify recorded MageBot duels")
+    parser.add_argument("replays", nargs="+", help="replay files (.mbr or .jsonl)")
+    parser.add_argument("--quiet", action="store_true", help="only verify, without printing the duel")
+    parser.add_argument("--from-turn", type=int, default=1, metavar="N", help="fast-forward to turn N before printing")
+    parser.add_argument("--search", choices=MAGEBOT_ENGINES, help="let this engine choose MageBot's moves instead of the recorded ones")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each MageBot turn")
+    args = parser.parse_args(argv)
+
+    if args.search is not None:
+        load_tablebase()
+        load_evaluation_weights(quiet=True)
+    failures = 0
+    for path in args.replays:
+        try:
+            ok, message = replay(path, args.quiet, args.from_turn, args.search, args.delay)
+        except (OSError, ValueError, KeyError) as error:
+            ok, message = False, f"unreadable: {error}"
+        failures += not ok
+        print(f"[Replay] {path}: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+# MageBot Server - Multi-session duel server
+# Notes: Hosts many duels in one asyncio loop. Each session plays the shared duel loop (run_duel), reading
+# the player's moves from an async queue and rendering the duel events as plain text lines into an outbox
+# queue; MageBot's search runs in a process pool so a deep search never stalls the other sessions. Transports: in-memory (load tests) and a TCP line protocol, a local
+# stand-in for the upcoming Discord bot. With instrumentation on, every search reports its statistics
+# back from the worker to the server's sinks (JSONL decision log, Prometheus /metrics endpoint).
+#
+# Usage: python console/magebotserver.py serve --port 8765 [--metrics-port 9108] [--search-log decisions.jsonl] [--record replays]
+#        python console/magebotserver.py loadtest --sessions 200 --workers 4
+
+# Import necessary modules
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import magebotcli
+from magebotcli import (
+    EFFECT_LABELS, EV_BURN, EV_CAST, EV_DAMAGE, EV_EFFECT, EV_END, EV_INVALID, EV_PASS, EV_SKIP, EV_TURN, MAGEBOT,
+    MAGEBOT_ENGINE, MAGEBOT_ENGINES, MAGEBOT_TIME_BUDGET, PLAYER, DuelLog, JsonlSink, NullSink, PrometheusSink,
+    WEIGHTS_PATH, active_effect_names, all_spells, duel_seed, enable_search_monitor, load_evaluation_weights,
+    load_tablebase, magebot_choose_spell, new_duel_state, open_replay_sink, run_duel, spell_names,
+)
+
+PROMPT = "Your turn! Type a spell name:"
+END = "Duel over:"
+
+
+# Worker process initializer: the tuned evaluation weights and the endgame tablebase, like the CLI
+def init_worker():
+    load_evaluation_weights(WEIGHTS_PATH, quiet=True)
+    load_tablebase(quiet=True)
+
+# Runs in a worker process. Returns (spell, decision record), the record being None unless `instrument`.
+def choose_spell_job(state, possible_spells, engine, time_budget, instrument=False):
+    if not instrument:
+        return magebot_choose_spell(state, possible_spells, engine=engine, time_budget=time_budget), None
+    monitor = magebotcli.search_monitor or enable_search_monitor()
+    name = magebot_choose_spell(state, possible_spells, engine=engine, time_budget=time_budget)
+    return name, monitor.last
+
+# Nearest-rank percentile of a list of numbers (q in 0..100)
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def state_line(state):
+    def side(name, hp, res, mana, effects):
+        return f"{name}: {hp} HP | Resistance: {res} | Mana: {mana}" + (f" | Effects: {', '.join(effects)}" if effects else "")
+    return (side("You", state.player_hp, state.player_res, state.player_mana, active_effect_names(state, PLAYER)) + " || "
+            + side("MageBot", state.magebot_hp, state.magebot_res, state.magebot_mana, active_effect_names(state, MAGEBOT)))
+
+
+# ---- Duel session ----
+class SessionAbandoned(Exception):
+    pass
+
+
+# Renders the duel events as the protocol's text lines
+class OutboxSink(NullSink):
+    def __init__(self, send):
+        self.send = send
+        self.cast = None  # line of the latest cast, completed by its damage and effect events
+
+    def event(self, event, state):
+        kind, side, a, b = event
+        if kind == EV_DAMAGE:
+            self.cast += f" {a} damage dealt."
+            return
+        if kind == EV_EFFECT:
+            self.cast += f" Target is now {EFFECT_LABELS[a]} for {b} turn(s)!"
+            return
+        self.flush()
+        actor = "You" if side == PLAYER else "MageBot"
+        if kind == EV_TURN and side == PLAYER:
+            self.send(state_line(state))
+        elif kind == EV_BURN:
+            self.send(f"[Burn] {actor} takes burn damage!")
+        elif kind == EV_SKIP:
+            self.send(f"[Effect] {actor} skips the turn!")
+        elif kind == EV_CAST:
+            self.cast = f"{actor} casts {spell_names[a]}."
+        elif kind == EV_INVALID:
+            self.send("Unknown spell. Turn lost." if a < 0 else f"Not enough mana to cast {spell_names[a]}! Turn lost.")
+        elif kind == EV_PASS:
+            self.send("MageBot passes its turn." if side == MAGEBOT else "You pass your turn.")
+        elif kind == EV_END:
+            self.send(state_line(state))
+            self.send(f"{END} {'you defeated MageBot!' if side == PLAYER else 'you lost against MageBot...'}")
+
+    def flush(self):
+        if self.cast is not None:
+            self.send(self.cast)
+            self.cast = None
+
+
+# One duel on the shared duel loop (run_duel). The seed of its effect rolls is sent to the player
+# with the first line and written to the replay file (`sinks`), so a reported duel can be replayed exactly.
+class DuelSession:
+    def __init__(self, manager, session_id, seed, sinks=()):
+        self.manager = manager
+        self.session_id = session_id
+        self.seed = seed
+        self.rng = random.Random(self.seed)
+        self.state = new_duel_state()
+        self.sinks = list(sinks)
+        self.moves = asyncio.Queue()   # player input lines, None when the player leaves
+        self.outbox = asyncio.Queue()  # text lines for the player, None when the session ends
+        self.winner = None
+
+    def send(self, line):
+        self.outbox.put_nowait(line)
+
+    async def player_move(self, state):
+        self.state = state
+        self.send(PROMPT)
+        action = await self.moves.get()
+        if action is None:
+            raise SessionAbandoned()
+        return action.strip()
+
+    async def magebot_move(self, state, possible_spells):
+        self.state = state
+        started = time.perf_counter()
+        name = await self.manager.choose_spell(state, possible_spells)
+        self.manager.move_latencies.append(time.perf_counter() - started)
+        return name
+
+    async def run(self):
+        self.send(f"Session {self.session_id}: the duel begins! (seed {self.seed})")
+        log = DuelLog([OutboxSink(self.send)] + self.sinks)
+        log.begin(self.seed, self.state)
+        try:
+            self.state = await run_duel(self.state, self.rng, log, self.player_move, self.magebot_move)
+            self.winner = "player" if self.state.magebot_hp <= 0 else "magebot"
+        except SessionAbandoned:
+            self.winner = "abandoned"
+        finally:
+            log.close()
+            self.send(None)
+            self.manager.sessions.pop(self.session_id, None)
+
+    # Affordable spell names for the player (used by load test bots)
+    def player_spells(self):
+        return [name for name, spell in all_spells.items() if spell.get("mana_cost", 0) <= self.state.player_mana]
+
+
+# ---- Session manager ----
+class SessionManager:
+    # `sinks`: search instrumentation sinks (see magebotcli.SearchMonitor), fed from the worker records
+    # `record`: directory receiving a replay file per session (see magebotreplay.py), `record_format` "binary" or "jsonl"
+    def __init__(self, workers=None, engine=MAGEBOT_ENGINE, time_budget=MAGEBOT_TIME_BUDGET, seed=None, sinks=(),
+                 record=None, record_format="binary"):
+        self.workers = workers
+        self.engine = engine
+        self.time_budget = time_budget
+        self.seed = seed
+        self.sinks = list(sinks)
+        self.record = record
+        self.record_format = record_format
+        self.pool = None
+        self.sessions = {}
+        self.tasks = set()
+        self.move_latencies = []  # seconds from MageBot's turn to its searched reply (pool queueing included)
+        self._next_id = 0
+
+    async def __aenter__(self):
+        # Spawned (not forked) workers: a forked worker would inherit the client sockets open at that
+        # moment and keep those connections alive after the session closes them. Each worker starts
+        # with the tuned evaluation weights and the tablebase (see init_worker).
+        if self.record:
+            os.makedirs(self.record, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_worker)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+    def open_session(self):
+        self._next_id += 1
+        seed = random.randrange(1 << 63) if self.seed is None else duel_seed(f"{self.seed}-{self._next_id}")
+        replay_sinks = []
+        if self.record:
+            extension = "jsonl" if self.record_format == "jsonl" else "mbr"
+            name = f"session-{time.strftime('%Y%m%d-%H%M%S')}-{self._next_id}-{seed:x}.{extension}"
+            replay_sinks.append(open_replay_sink(os.path.join(self.record, name)))
+        session = DuelSession(self, self._next_id, seed, replay_sinks)
+        self.sessions[session.session_id] = session
+        task = asyncio.get_running_loop().create_task(session.run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return session
+
+    async def choose_spell(self, state, possible_spells):
+        loop = asyncio.get_running_loop()
+        name, record = await loop.run_in_executor(self.pool, choose_spell_job, state, possible_spells, self.engine,
+                                                  self.time_budget, bool(self.sinks))
+        if record is not None:
+            for sink in self.sinks:
+                sink.record(record)
+        return name
+
+    def latency_report(self):
+        latencies = self.move_latencies
+        return {
+            "moves": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        }
+
+
+# ---- Transports ----
+# TCP line protocol: one duel per connection, one spell name per line, "quit" to leave
+async def serve_tcp(manager, host="127.0.0.1", port=8765):
+    async def handle(reader, writer):
+        session = manager.open_session()
+
+        async def pump_output():
+            while True:
+                line = await session.outbox.get()
+                if line is None:
+                    break
+                writer.write((line + "\n").encode("utf-8"))
+                await writer.drain()
+            writer.close()
+
+        output = asyncio.ensure_future(pump_output())
+        try:
+            while not output.done():
+                data = await reader.readline()
+                if not data or data.strip().lower() == b"quit":
+                    break
+                session.moves.put_nowait(data.decode("utf-8", "replace"))
+        finally:
+            session.moves.put_nowait(None)
+            await output
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+# Minimal HTTP endpoint for Prometheus scrapes: any request gets the sink's exposition text
+async def serve_metrics(sink, host="127.0.0.1", port=9108):
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        body = sink.exposition().encode("utf-8")
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+# In-memory bot playing a random affordable spell after `think_time` seconds at every prompt
+async def bot_client(session, rng, think_time=0.0):
+    while True:
+        line = await session.outbox.get()
+        if line is None:
+            return session.winner
+        if line == PROMPT:
+            if think_time:
+                await asyncio.sleep(think_time)
+            spells = session.player_spells()
+            session.moves.put_nowait(rng.choice(spells) if spells else "")
+
+# Plays `sessions` concurrent duels against in-memory bots and reports per-move latency
+async def run_load_test(sessions=100, workers=None, engine=MAGEBOT_ENGINE, time_budget=MAGEBOT_TIME_BUDGET, think_time=0.0, seed=0, sinks=(),
+                        record=None, record_format="binary"):
+    rng = random.Random(seed)
+    async with SessionManager(workers, engine, time_budget, seed, sinks, record, record_format) as manager:
+        started = time.perf_counter()
+        clients = [bot_client(manager.open_session(), random.Random(rng.random()), think_time) for _ in range(sessions)]
+        winners = await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - started
+        report = manager.latency_report()
+    report.update({
+        "sessions": sessions,
+        "engine": engine,
+        "elapsed_s": elapsed,
+        "moves_per_s": report["moves"] / elapsed if elapsed else 0.0,
+        "magebot_wins": winners.count("magebot"),
+        "player_wins": winners.count("player"),
+    })
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MageBot multi-session duel server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="serve duels over a TCP line protocol")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    load = subparsers.add_parser("loadtest", help="play concurrent in-memory duels and report latency")
+    load.add_argument("--sessions", type=int, default=100)
+    load.add_argument("--think-time", type=float, default=0.0, help="bot think time per move, in seconds")
+    load.add_argument("--seed", type=int, default=0)
+    for sub in (serve, load):
+        sub.add_argument("--workers", type=int, default=os.cpu_count())
+        sub.add_argument("--engine", choices=MAGEBOT_ENGINES, default=MAGEBOT_ENGINE)
+        sub.add_argument("--time-budget", type=float, default=MAGEBOT_TIME_BUDGET)
+        sub.add_argument("--search-log", metavar="FILE", help="append one JSON line per MageBot decision")
+        sub.add_argument("--record", metavar="DIR", help="write a replay file of each session to DIR (see magebotreplay.py)")
+        sub.add_argument("--record-format", choices=("binary", "jsonl"), default="binary")
+    serve.add_argument("--metrics-port", type=int, help="serve Prometheus counters of MageBot's searches on this port")
+    args = parser.parse_args(argv)
+    sinks = [JsonlSink(args.search_log)] if args.search_log else []
+
+    if args.command == "serve":
+        metrics = None
+        if args.metrics_port:
+            metrics = PrometheusSink()
+            sinks.append(metrics)
+
+        async def serve_forever():
+            async with SessionManager(args.workers, args.engine, args.time_budget, sinks=sinks,
+                                      record=args.record, record_format=args.record_format) as manager:
+                print(f"MageBot server listening on {args.host}:{args.port}")
+                servers = [serve_tcp(manager, args.host, args.port)]
+                if metrics is not None:
+                    print(f"Metrics on http://{args.host}:{args.metrics_port}/metrics")
+                    servers.append(serve_metrics(metrics, args.host, args.metrics_port))
+                await asyncio.gather(*servers)
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            print("\nClosing MageBot server.")
+    else:
+        report = asyncio.run(run_load_test(args.sessions, args.workers, args.engine, args.time_budget, args.think_time, args.seed, sinks,
+                                         args.record, args.record_format))
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# MageBot Sim - Headless AI-vs-AI duel simulator
+# Notes: Plays policy-vs-policy duels with the console's turn rules, without any input, output or
+# sleeps, and spreads the games over a process pool. Used to balance spells. The statistics are counted
+# in a plain turn loop; with --record the games go through the console's duel loop (run_duel) instead,
+# the statistics are gathered from the duel events and every game is written to a replay file.
+#
+# Usage: python console/magebotsim.py --games 20000 --player random --magebot minimax --workers 8
+
+# Import necessary modules
+import argparse
+import cProfile
+import json
+import os
+import random
+import sys
+import weakref
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import magebotcli
+from magebotcli import (
+    EV_BURN, EV_CAST, EV_EFFECT, EV_END, EV_SKIP, EV_TURN, MAGEBOT, MANA, PLAYER, SIDE_SIZE, TURN,
+    EFFECT_LABELS, DuelLog, DuelState, NullSink, spell_costs, spell_ids, spell_names, spell_table,
+    affordable_spell_ids, apply_spell, begin_turn, duel_seed, end_turn, evaluate_state, is_turn_skipped,
+    new_duel_state, open_replay_sink, run_duel_sync, skip_turn,
+)
+
+MAX_TURNS = 200      # a duel still running after this many turns is a draw
+CHUNK_SIZE = 250     # games per worker task
+
+
+# ---- Policies ----
+# A policy receives a state where MageBot is to move (the player side is mirrored before the call)
+# and a seeded random.Random, and returns a spell name or None to pass.
+
+# Swap the two sides so that the side to move is always seen as MageBot
+def mirror_state(state):
+    return DuelState._make(state[SIDE_SIZE:TURN] + state[:SIDE_SIZE] + (1 - state[TURN],))
+
+def minimax_policy(state, rng, depth=magebotcli.MAGEBOT_SEARCH_DEPTH):
+    if not affordable_spell_ids(state):
+        return None
+    return magebotcli.magebot_choose_spell(state, depth=depth)
+
+def expectimax_policy(state, rng):
+    if not affordable_spell_ids(state):
+        return None
+    return magebotcli.magebot_choose_spell(state, engine="expectimax")
+
+# One kept MCTS tree per game (the game's rng), so results do not depend on how games are chunked.
+# When both sides play mcts they share it and it simply restarts at every move.
+_mcts_trees = weakref.WeakKeyDictionary()
+
+def mcts_policy(state, rng):
+    if not affordable_spell_ids(state):
+        return None
+    tree = _mcts_trees.get(rng)
+    if tree is None:
+        tree = _mcts_trees[rng] = magebotcli.MctsTree()
+    return magebotcli.mcts_search(state, tree=tree, seed=rng.randrange(1 << 63))[0]
+
+def random_policy(state, rng):
+    choices = affordable_spell_ids(state)
+    if not choices:
+        return None
+    return spell_names[rng.choice(choices)]
+
+# One-ply lookahead on the heuristic (effects never proc in the lookahead)
+def greedy_policy(state, rng):
+    best_score = -float('inf')
+    best_spell = None
+    for spell_id in affordable_spell_ids(state):
+        score = evaluate_state(apply_spell(state, spell_id))
+        if score > best_score:
+            best_score = score
+            best_spell = spell_names[spell_id]
+    return best_spell
+
+POLICIES = {
+    "minimax": minimax_policy,
+    "expectimax": expectimax_policy,
+    "mcts": mcts_policy,
+    "random": random_policy,
+    "greedy": greedy_policy,
+}
+
+
+# ---- Headless duel ----
+def new_stats():
+    return {
+        "games": 0,
+        "wins": Counter(),           # "player" / "magebot" / "draw"
+        "turns": 0,
+        "spell_usage": {"player": Counter(), "magebot": Counter()},
+        "effect_procs": Counter(),
+        "burn_ticks": 0,
+        "skipped_turns": 0,
+    }
+
+def merge_stats(total, stats):
+    total["games"] += stats["games"]
+    total["wins"].update(stats["wins"])
+    total["turns"] += stats["turns"]
+    for side in ("player", "magebot"):
+        total["spell_usage"][side].update(stats["spell_usage"][side])
+    total["effect_procs"].update(stats["effect_procs"])
+    total["burn_ticks"] += stats["burn_ticks"]
+    total["skipped_turns"] += stats["skipped_turns"]
+    return total
+
+# Collects the statistics of a run from the duel events
+class StatsSink(NullSink):
+    SIDES = ("player", "magebot", "draw")
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def event(self, event, state):
+        kind, side, a, b = event
+        stats = self.stats
+        if kind == EV_TURN:
+            stats["turns"] += 1
+        elif kind == EV_CAST:
+            stats["spell_usage"][self.SIDES[side]][spell_names[a]] += 1
+        elif kind == EV_EFFECT:
+            stats["effect_procs"][EFFECT_LABELS[a]] += 1
+        elif kind == EV_BURN:
+            stats["burn_ticks"] += 1
+        elif kind == EV_SKIP:
+            stats["skipped_turns"] += 1
+        elif kind == EV_END:
+            stats["games"] += 1
+            stats["wins"][self.SIDES[side]] += 1
+
+# Plays one duel, player first, and records it into `stats`. Returns the winner.
+# Policies are POLICIES names or policy functions. `sinks`: extra duel log sinks (replay file).
+def play_duel(player_policy, magebot_policy, seed, stats=None, max_turns=MAX_TURNS, state=None, sinks=()):
+    if stats is None:
+        stats = new_stats()
+    # Effect rolls use their own RNG, which the policies never touch: a recorded game then replays
+    # from its seed and moves alone
+    rng = random.Random(duel_seed(seed))
+    policy_rng = random.Random(f"{seed}-policies")
+    policies = tuple(POLICIES[policy] if isinstance(policy, str) else policy for policy in (player_policy, magebot_policy))
+    if state is None:
+        state = new_duel_state()
+    if not sinks:
+        return count_duel(policies, state, rng, policy_rng, stats, max_turns)
+    log = DuelLog([StatsSink(stats), *sinks])
+    log.begin(duel_seed(seed), state)
+
+    def player_move(state):
+        return policies[PLAYER](mirror_state(state), policy_rng)
+
+    def magebot_move(state, possible_spells):
+        return policies[MAGEBOT](state, policy_rng)
+
+    try:
+        state = run_duel_sync(state, rng, log, player_move, magebot_move, max_turns=max_turns)
+    finally:
+        log.close()
+    if state.magebot_hp <= 0:
+        return "player"
+    if state.player_hp <= 0:
+        return "magebot"
+    return "draw"
+
+# play_duel without a duel log: the same turns as run_duel, with the statistics counted in the loop
+# instead of gathered from events (about twice as fast, for runs that record nothing)
+def count_duel(policies, state, rng, policy_rng, stats, max_turns):
+    sides = StatsSink.SIDES
+    turns = 0
+    while state.player_hp > 0 and state.magebot_hp > 0:
+        if max_turns is not None and turns >= max_turns:
+            break
+        turns += 1
+        side = state[TURN]
+        ticked = begin_turn(state)
+        if ticked is not state:
+            stats["burn_ticks"] += 1
+        state = ticked
+        skipped = is_turn_skipped(state)
+        if skipped:
+            stats["skipped_turns"] += 1
+            state = skip_turn(state)
+        if state.player_hp <= 0 or state.magebot_hp <= 0:
+            break
+        if not skipped:
+            if side == PLAYER:
+                name = policies[PLAYER](mirror_state(state), policy_rng)
+            else:
+                # MageBot is only asked when it can afford a spell (spell ids are sorted by cost)
+                name = policies[MAGEBOT](state, policy_rng) if state[SIDE_SIZE + MANA] >= spell_costs[0] else None
+            spell_id = spell_ids.get(name)
+            if spell_id is not None and spell_costs[spell_id] <= state[side * SIDE_SIZE + MANA]:
+                stats["spell_usage"][sides[side]][name] += 1
+                effect, duration, chance = spell_table[spell_id][3:]
+                proc = effect is not None and rng.random() < chance
+                if proc:
+                    stats["effect_procs"][EFFECT_LABELS[effect]] += 1
+                state = apply_spell(state, spell_id, proc)
+        state = end_turn(state)
+    winner = "player" if state.magebot_hp <= 0 else "magebot" if state.player_hp <= 0 else "draw"
+    stats["turns"] += turns
+    stats["games"] += 1
+    stats["wins"][winner] += 1
+    return winner
+
+# Worker task: plays games [start, start + count) of a run, writing replay files to `record` if given
+def play_chunk(player_policy, magebot_policy, seed, start, count, max_turns=MAX_TURNS, record=None, record_format="binary"):
+    stats = new_stats()
+    for index in range(start, start + count):
+        sinks = []
+        if record:
+            extension = "jsonl" if record_format == "jsonl" else "mbr"
+            sinks.append(open_replay_sink(os.path.join(record, f"game-{seed}-{index}.{extension}")))
+        play_duel(player_policy, magebot_policy, f"{seed}-{index}", stats, max_turns, sinks=sinks)
+    return stats
+
+# Summary of aggregated stats (JSON friendly)
+def summarize(stats):
+    games = stats["games"] or 1
+    return {
+        "games": stats["games"],
+        "win_rate": {side: stats["wins"][side] / games for side in ("player", "magebot", "draw")},
+        "avg_turns": stats["turns"] / games,
+        "spell_usage": {side: dict(stats["spell_usage"][side].most_common()) for side in ("player", "magebot")},
+        "effect_procs": dict(stats["effect_procs"]),
+        "burn_ticks": stats["burn_ticks"],
+        "skipped_turns": stats["skipped_turns"],
+    }
+
+# Runs `games` duels over `workers` processes and yields the aggregated stats after every finished chunk.
+# Game i always uses the same seed, so a run is reproducible whatever the worker count.
+def run_simulation(player_policy, magebot_policy, games, seed=0, workers=None, chunk_size=CHUNK_SIZE, max_turns=MAX_TURNS, record=None, record_format="binary"):
+    total = new_stats()
+    chunks = [(start, min(chunk_size, games - start)) for start in range(0, games, chunk_size)]
+    if record:
+        os.makedirs(record, exist_ok=True)
+    if workers == 1:
+        for start, count in chunks:
+            yield merge_stats(total, play_chunk(player_policy, magebot_policy, seed, start, count, max_turns, record, record_format))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_chunk, player_policy, magebot_policy, seed, start, count, max_turns, record, record_format)
+                   for start, count in chunks]
+        for future in as_completed(futures):
+            yield merge_stats(total, future.result())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless MageBot AI-vs-AI duel simulator")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--player", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--magebot", choices=sorted(POLICIES), default="minimax")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS)
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    parser.add_argument("--record", metavar="DIR", help="write every game to a replay file in DIR (see magebotreplay.py)")
+    parser.add_argument("--record-format", choices=("binary", "jsonl"), default="binary")
+    parser.add_argument("--profile", metavar="FILE", help="cProfile the run in this process (forces --workers 1) and write the stats to FILE")
+    args = parser.parse_args(argv)
+
+    profiler = None
+    if args.profile:
+        args.workers = 1
+        profiler = cProfile.Profile()
+        profiler.enable()
+    stats = new_stats()
+    for stats in run_simulation(args.player, args.magebot, args.games, args.seed, args.workers, args.chunk_size, args.max_turns,
+                                args.record, args.record_format):
+        if not args.quiet:
+            summary = summarize(stats)
+            print(f"[{stats['games']}/{args.games}] player {summary['win_rate']['player']:.1%} | "
+                  f"magebot {summary['win_rate']['magebot']:.1%} | draw {summary['win_rate']['draw']:.1%} | "
+                  f"avg turns {summary['avg_turns']:.1f}", file=sys.stderr)
+    if profiler is not None:
+        magebotcli.save_profile(profiler, args.profile)
+    print(json.dumps(summarize(stats), indent=2))
+
+if __name__ == "__main__":
+    main()
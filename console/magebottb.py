@@ -0,0 +1,175 @@
+# MageBot TB - Offline builder for the endgame tablebase
+# Notes: Retrograde solve of the deterministic duel (effects never proc) over every state with
+# 1..MAX_HP HP, 0..MAX_MANA mana and resistance capped at the strongest attack, for the side to move.
+# The result is written to magebot.tb and memory-mapped by magebotcli.Tablebase at runtime.
+# Requires numpy (build only, the runtime lookup does not).
+#
+# Usage: python console/magebottb.py [--output magebot.tb] [--force]
+
+# Import necessary modules
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from magebotcli import (
+    ATTACK, HEALING, MAX_HP, MAX_MANA, MANA_REGEN, TABLEBASE_PATH, TB_DRAW, TB_FORMAT_VERSION, TB_HEADER_FORMAT,
+    TB_LOSS, TB_MAGIC, TB_MANA_LEVELS, TB_NO_MOVE, TB_RES_CAP, TB_RES_LEVELS, TB_SIDE_STATES, TB_STATES, TB_WIN,
+    Tablebase, spell_names, spell_table, tablebase_signature,
+)
+
+
+# Vectorized magebotcli.tablebase_index (resistance must already be capped)
+def _index(mover_hp, mover_res, mover_mana, opponent_hp, opponent_res, opponent_mana):
+    mover = ((mover_hp - 1) * TB_RES_LEVELS + mover_res) * TB_MANA_LEVELS + mover_mana
+    opponent = ((opponent_hp - 1) * TB_RES_LEVELS + opponent_res) * TB_MANA_LEVELS + opponent_mana
+    return (mover * TB_SIDE_STATES + opponent).astype(np.int32)
+
+# Child index (from the opponent's point of view, as it is then to move) of every state for every move,
+# plus the states where the move is allowed and those where it kills the opponent outright.
+# Rows are the spells in spell id order, then the pass (only allowed when nothing is affordable).
+def _successors():
+    index = np.arange(TB_STATES, dtype=np.int64)
+    opponent_mana = index % TB_MANA_LEVELS
+    index //= TB_MANA_LEVELS
+    opponent_res = index % TB_RES_LEVELS
+    index //= TB_RES_LEVELS
+    opponent_hp = index % MAX_HP + 1
+    index //= MAX_HP
+    mover_mana = index % TB_MANA_LEVELS
+    index //= TB_MANA_LEVELS
+    mover_res = index % TB_RES_LEVELS
+    mover_hp = index // TB_RES_LEVELS + 1
+    del index
+
+    moves = len(spell_table) + 1
+    children = np.zeros((moves, TB_STATES), dtype=np.int32)
+    legal = np.zeros((moves, TB_STATES), dtype=bool)
+    kills = np.zeros((moves, TB_STATES), dtype=bool)
+    for spell_id, (kind, value, cost, effect, duration, chance) in enumerate(spell_table):
+        legal[spell_id] = mover_mana >= cost
+        mana = np.minimum(MAX_MANA, np.maximum(mover_mana - cost, 0) + MANA_REGEN)
+        if kind == ATTACK:
+            hp = opponent_hp - np.maximum(0, value - opponent_res)
+            kills[spell_id] = legal[spell_id] & (hp <= 0)
+            children[spell_id] = _index(np.maximum(hp, 1), 0, opponent_mana, mover_hp, mover_res, mana)
+        elif kind == HEALING:
+            children[spell_id] = _index(opponent_hp, opponent_res, opponent_mana, np.minimum(MAX_HP, mover_hp + value), mover_res, mana)
+        else:
+            children[spell_id] = _index(opponent_hp, opponent_res, opponent_mana, mover_hp, np.minimum(TB_RES_CAP, mover_res + value), mana)
+    # Nothing affordable: the turn is passed and mana regenerates
+    legal[-1] = ~legal[:-1].any(axis=0)
+    children[-1] = _index(opponent_hp, opponent_res, opponent_mana, mover_hp, mover_res, np.minimum(MAX_MANA, mover_mana + MANA_REGEN))
+    return children, legal, kills
+
+# Returns (outcome, best_move, plies_to_end) arrays over all TB_STATES states
+def solve(verbose=True):
+    started = time.perf_counter()
+    children, legal, kills = _successors()
+    moves = list(range(len(spell_table))) + [TB_NO_MOVE]
+    outcome = np.full(TB_STATES, TB_DRAW, dtype=np.int8)
+    best = np.full(TB_STATES, TB_NO_MOVE, dtype=np.uint8)
+    plies = np.zeros(TB_STATES, dtype=np.int16)
+
+    # Ply 1: a spell kills the opponent (lowest spell id wins ties)
+    for row in reversed(range(len(spell_table))):
+        best[kills[row]] = moves[row]
+    won = kills.any(axis=0)
+    outcome[won] = TB_WIN
+    plies[won] = 1
+    del kills
+    if verbose:
+        print(f"[Tablebase] ply 1: +{int(won.sum())} wins", file=sys.stderr)
+
+    # Ply k: win if a move reaches a state lost for the opponent, loss if every move reaches a state won
+    # for the opponent (the loser picks the longest defence). Decisions are applied after the whole
+    # sweep, so plies are exact distances to the end of the duel.
+    ply = 1
+    while True:
+        ply += 1
+        todo = np.nonzero(outcome == TB_DRAW)[0]
+        found = np.zeros(len(todo), dtype=bool)
+        win_move = np.full(len(todo), TB_NO_MOVE, dtype=np.uint8)
+        all_won = np.ones(len(todo), dtype=bool)
+        delay = np.full(len(todo), -1, dtype=np.int16)
+        delay_move = np.full(len(todo), TB_NO_MOVE, dtype=np.uint8)
+        for row, move in enumerate(moves):
+            allowed = legal[row, todo]
+            child = children[row, todo]
+            child_outcome = outcome[child]
+            wins = allowed & (child_outcome == TB_LOSS) & ~found
+            win_move[wins] = move
+            found |= wins
+            all_won &= ~allowed | (child_outcome == TB_WIN)
+            child_plies = plies[child]
+            longer = allowed & (child_plies > delay)
+            delay[longer] = child_plies[longer]
+            delay_move[longer] = move
+        losses = all_won & ~found
+        if not found.any() and not losses.any():
+            break
+        outcome[todo[found]] = TB_WIN
+        best[todo[found]] = win_move[found]
+        plies[todo[found]] = ply
+        outcome[todo[losses]] = TB_LOSS
+        best[todo[losses]] = delay_move[losses]
+        plies[todo[losses]] = delay[losses] + 1
+        if verbose:
+            print(f"[Tablebase] ply {ply}: +{int(found.sum())} wins, +{int(losses.sum())} losses", file=sys.stderr)
+
+    # Draws: keep a move that does not lose, for reference (MageBot searches drawn states itself)
+    drawn = np.nonzero(outcome == TB_DRAW)[0]
+    draw_move = np.full(len(drawn), TB_NO_MOVE, dtype=np.uint8)
+    for row in reversed(range(len(moves))):
+        keeps = legal[row, drawn] & (outcome[children[row, drawn]] == TB_DRAW)
+        draw_move[keeps] = moves[row]
+    best[drawn] = draw_move
+    if verbose:
+        counts = np.bincount(outcome, minlength=3)
+        print(f"[Tablebase] solved {TB_STATES} states in {time.perf_counter() - started:.1f}s: "
+              f"{counts[TB_WIN]} wins, {counts[TB_LOSS]} losses, {counts[TB_DRAW]} draws", file=sys.stderr)
+    return outcome, best, plies
+
+def write_tablebase(path, outcome, best):
+    entries = (outcome.astype(np.uint8) << 4) | best
+    header = struct.pack(TB_HEADER_FORMAT, TB_MAGIC, TB_FORMAT_VERSION, tablebase_signature(), MAX_HP, TB_RES_LEVELS, MAX_MANA, len(spell_names))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(entries.tobytes())
+    os.replace(tmp_path, path)
+
+# True if `path` holds a tablebase for the current spell table
+def is_up_to_date(path=TABLEBASE_PATH):
+    try:
+        Tablebase(path).close()
+    except (OSError, ValueError, struct.error):
+        return False
+    return True
+
+# Builds the tablebase unless an up-to-date one is already there. Returns True if it was (re)built.
+def ensure_tablebase(path=TABLEBASE_PATH, force=False, verbose=True):
+    if not force and is_up_to_date(path):
+        if verbose:
+            print(f"[Tablebase] {path} is up to date.", file=sys.stderr)
+        return False
+    if len(spell_names) >= TB_NO_MOVE:
+        raise ValueError(f"the tablebase format holds at most {TB_NO_MOVE - 1} spells")
+    outcome, best, plies = solve(verbose)
+    write_tablebase(path, outcome, best)
+    if verbose:
+        print(f"[Tablebase] wrote {path}", file=sys.stderr)
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the MageBot endgame tablebase")
+    parser.add_argument("--output", default=TABLEBASE_PATH)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the table matches the spell table")
+    args = parser.parse_args(argv)
+    ensure_tablebase(args.output, args.force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# MageBot Tune - Self-play tuning of the evaluate_state weights
+# Notes: SPSA over the evaluation weights (hp stays at 1.0, it sets the scale against the +/-100 win
+# score). Every iteration plays the two perturbed weight sets against each other in seeded game pairs
+# (same seed, sides swapped) spread over a process pool, and a match stops as soon as one side is
+# clearly losing. The tuned weights are then validated against the defaults and written, with the
+# win-rate confidence interval, to magebot_weights.json, which the CLI loads at startup.
+#
+# Usage: python console/magebottune.py --iterations 40 --pairs 64 --workers 8
+
+# Import necessary modules
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from magebotcli import (
+    DEFAULT_EVAL_WEIGHTS, EVAL_FEATURES, WEIGHTS_PATH, TranspositionTable, affordable_spell_ids,
+    magebot_choose_spell,
+)
+from magebotsim import MAX_TURNS, play_duel
+
+TUNE_ENGINE = "alphabeta"
+TUNE_ENGINES = ("minimax", "batch", "alphabeta", "expectimax")  # deterministic engines: seeded matches are reproducible
+TUNE_DEPTH = 2
+CHUNK_PAIRS = 8             # game pairs per worker task
+EARLY_STOP_Z = 3.0          # a match stops once the score is this many standard errors away from 50%
+EARLY_STOP_MIN_PAIRS = 16
+WEIGHT_LIMIT = 5.0
+
+
+# ---- Matches ----
+# Policy searching with `weights` (a fresh transposition table per game: its scores depend on the weights)
+def weights_policy(weights, engine=TUNE_ENGINE, depth=TUNE_DEPTH):
+    table = TranspositionTable()
+
+    def policy(state, rng):
+        if not affordable_spell_ids(state):
+            return None
+        return magebot_choose_spell(state, table=table, depth=depth, engine=engine, weights=weights)
+    return policy
+
+# Worker task: game pairs [start, start + count) of `a` against `b`. Both games of a pair use the same
+# seed, `a` playing MageBot (second) then the player (first).
+# Returns one (points as MageBot, points as player) tuple per pair: 1 win, 0.5 draw, 0 loss.
+def play_pairs(a, b, seed, start, count, engine=TUNE_ENGINE, depth=TUNE_DEPTH, max_turns=MAX_TURNS):
+    points = {"draw": 0.5}
+    results = []
+    for index in range(start, start + count):
+        game_seed = f"{seed}-{index}"
+        as_magebot = play_duel(weights_policy(b, engine, depth), weights_policy(a, engine, depth), game_seed, max_turns=max_turns)
+        as_player = play_duel(weights_policy(a, engine, depth), weights_policy(b, engine, depth), game_seed, max_turns=max_turns)
+        results.append((points.get(as_magebot, float(as_magebot == "magebot")), points.get(as_player, float(as_player == "player"))))
+    return results
+
+# Mean score of a match and its standard error, pairs being the independent samples
+def match_score(results):
+    pair_scores = [(magebot + player) / 2 for magebot, player in results]
+    n = len(pair_scores)
+    if n == 0:
+        return 0.5, 0.0
+    mean = sum(pair_scores) / n
+    if n == 1:
+        return mean, 0.0
+    variance = sum((score - mean) ** 2 for score in pair_scores) / (n - 1)
+    return mean, math.sqrt(variance / n)
+
+def _chunk_results(executor, jobs):
+    if executor is None:
+        for job in jobs:
+            yield play_pairs(*job)
+        return
+    futures = [executor.submit(play_pairs, *job) for job in jobs]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+# Plays up to `pairs` game pairs of `a` against `b`. Chunks are consumed in order, so the result (early
+# stop included) does not depend on the worker count. Returns (results, stopped_early).
+def run_match(executor, a, b, pairs, seed, early_stop=True, engine=TUNE_ENGINE, depth=TUNE_DEPTH, max_turns=MAX_TURNS, chunk_pairs=CHUNK_PAIRS):
+    jobs = [(a, b, seed, start, min(chunk_pairs, pairs - start), engine, depth, max_turns) for start in range(0, pairs, chunk_pairs)]
+    results = []
+    chunks = _chunk_results(executor, jobs)
+    try:
+        for chunk in chunks:
+            results.extend(chunk)
+            if early_stop and len(results) >= EARLY_STOP_MIN_PAIRS:
+                mean, error = match_score(results)
+                # Floored error: a clean sweep has no variance but is not infinitely certain
+                if abs(mean - 0.5) > EARLY_STOP_Z * max(error, 0.5 / len(results)):
+                    return results, len(results) < pairs
+    finally:
+        chunks.close()
+    return results, False
+
+
+# ---- SPSA ----
+def full_weights(tuned):
+    return (DEFAULT_EVAL_WEIGHTS[0],) + tuple(tuned)
+
+def _clip(weights):
+    return [max(-WEIGHT_LIMIT, min(WEIGHT_LIMIT, weight)) for weight in weights]
+
+# Simultaneous perturbation stochastic approximation: each iteration estimates the gradient of the match
+# score from one match between theta + c_k * delta and theta - c_k * delta (delta: random signs).
+# The perturbation must be large enough to change moves: the searches ignore small weight changes.
+# Yields a progress record after every iteration; the last one holds the tuned weights.
+def spsa(executor, iterations, pairs, seed=0, start=DEFAULT_EVAL_WEIGHTS, a=0.6, c=0.5, engine=TUNE_ENGINE, depth=TUNE_DEPTH, max_turns=MAX_TURNS):
+    rng = random.Random(seed)
+    theta = list(start[1:])
+    stability = max(1.0, iterations / 10)
+    for k in range(iterations):
+        a_k = a / (k + 1 + stability) ** 0.602
+        c_k = c / (k + 1) ** 0.101
+        delta = [rng.choice((-1, 1)) for _ in theta]
+        plus = _clip([weight + c_k * sign for weight, sign in zip(theta, delta)])
+        minus = _clip([weight - c_k * sign for weight, sign in zip(theta, delta)])
+        results, stopped = run_match(executor, full_weights(plus), full_weights(minus), pairs, f"{seed}-{k}",
+                                     engine=engine, depth=depth, max_turns=max_turns)
+        score, error = match_score(results)
+        # Score of plus minus score of minus, per unit of perturbation
+        gradient = (2 * score - 1) / (2 * c_k)
+        theta = _clip([weight + a_k * gradient * sign for weight, sign in zip(theta, delta)])
+        yield {
+            "iteration": k + 1,
+            "weights": full_weights(theta),
+            "score_plus": score,
+            "error": error,
+            "pairs": len(results),
+            "stopped_early": stopped,
+        }
+
+
+# ---- Report ----
+# Validation of `weights` against `baseline`: results and a 95% confidence interval of the score
+def validate(executor, weights, baseline, pairs, seed, engine=TUNE_ENGINE, depth=TUNE_DEPTH, max_turns=MAX_TURNS):
+    results, _ = run_match(executor, weights, baseline, pairs, f"{seed}-validation", early_stop=False,
+                           engine=engine, depth=depth, max_turns=max_turns)
+    games = [points for pair in results for points in pair]
+    score, error = match_score(results)
+    return {
+        "games": len(games),
+        "wins": games.count(1.0),
+        "losses": games.count(0.0),
+        "draws": games.count(0.5),
+        "score": score,
+        "ci95": [max(0.0, score - 1.96 * error), min(1.0, score + 1.96 * error)],
+        "baseline": dict(zip(EVAL_FEATURES, baseline)),
+    }
+
+def write_weights(path, weights, report):
+    data = {"weights": dict(zip(EVAL_FEATURES, weights))}
+    data.update(report)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune MageBot's evaluation weights by self-play")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--pairs", type=int, default=32, help="game pairs per SPSA match (fewer if a side is clearly losing)")
+    parser.add_argument("--validation-pairs", type=int, default=200, help="game pairs of the tuned weights against the defaults")
+    parser.add_argument("--engine", choices=TUNE_ENGINES, default=TUNE_ENGINE)
+    parser.add_argument("--depth", type=int, default=TUNE_DEPTH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS)
+    parser.add_argument("--output", default=WEIGHTS_PATH)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers != 1 else None
+    try:
+        weights = DEFAULT_EVAL_WEIGHTS
+        for record in spsa(executor, args.iterations, args.pairs, args.seed, engine=args.engine, depth=args.depth, max_turns=args.max_turns):
+            weights = record["weights"]
+            print(f"[{record['iteration']}/{args.iterations}] plus scored {record['score_plus']:.1%} over {record['pairs']} pairs"
+                  f"{' (stopped early)' if record['stopped_early'] else ''} | "
+                  + ", ".join(f"{feature} {weight:.3f}" for feature, weight in zip(EVAL_FEATURES, weights)), file=sys.stderr)
+        validation = validate(executor, weights, DEFAULT_EVAL_WEIGHTS, args.validation_pairs, args.seed,
+                              engine=args.engine, depth=args.depth, max_turns=args.max_turns)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    report = {
+        "engine": args.engine,
+        "depth": args.depth,
+        "iterations": args.iterations,
+        "pairs": args.pairs,
+        "seed": args.seed,
+        "elapsed_s": time.perf_counter() - started,
+        "validation": validation,
+    }
+    write_weights(args.output, weights, report)
+    print(f"[Tune] wrote {args.output}", file=sys.stderr)
+    print(json.dumps(dict(report, weights=dict(zip(EVAL_FEATURES, weights))), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# MageBot tests - Equivalence checks between the search engines and their references
+# Notes: Each faster engine must score exactly like the plain reference it replaces, on random duel
+# states with effect counters on both sides and either side to move. The search caches (transposition
+# table, ponderer, kept MCTS tree) are checked on their own. Recorded duels must replay exactly,
+# and the endgame tablebase must agree with itself (the solve takes about a minute when magebot.tb is
+# missing or stale; numpy is needed for it).
+#
+# Usage: cd console && python -m pytest -q
+
+# Import necessary modules
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import magebotcli
+from magebotcli import MAGEBOT, MAX_HP, MAX_MANA, PLAYER, DuelState, minimax
+from magebotreplay import replay
+from magebotsim import play_chunk
+
+STATES = 150
+
+
+def random_state(rng, turn=None):
+    sides = []
+    for _ in range(2):
+        effects = [0, 0, 0]
+        if rng.random() < 0.3:
+            effects[rng.randrange(3)] = rng.randint(1, 2)
+        sides += [rng.randint(1, MAX_HP), rng.randint(0, 6), rng.randint(0, MAX_MANA)] + effects
+    return DuelState(*sides, rng.choice((PLAYER, MAGEBOT)) if turn is None else turn)
+
+def random_states(seed, count=STATES, turn=None):
+    rng = random.Random(seed)
+    return [random_state(rng, turn) for _ in range(count)]
+
+
+# ---- Batched minimax ----
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_batch_minimax_scores_match_minimax(depth):
+    np = pytest.importorskip("numpy")
+    states = random_states(depth)
+    scores = magebotcli.batch_minimax(np.array(states, dtype=np.int16), depth)
+    assert [float(score) for score in scores] == [minimax(state, depth) for state in states]
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_batch_engine_chooses_like_minimax(depth):
+    pytest.importorskip("numpy")
+    for state in random_states(10 + depth, turn=MAGEBOT):
+        assert (magebotcli.magebot_choose_spell(state, table=None, depth=depth, engine="batch")
+                == magebotcli.magebot_choose_spell(state, table=None, depth=depth, engine="minimax"))
+
+# Spells are data: an attack without damage (a pure effect) still breaks the target's resistance
+def test_batch_minimax_follows_spell_kinds(tmp_path):
+    pytest.importorskip("numpy")
+    with open(magebotcli.SPELLS_PATH, encoding="utf-8") as f:
+        spells = json.load(f)
+    spells["spells"].append({"name": "Torpor", "kind": "attack", "damage": 0, "mana_cost": 1, "effect": "freeze", "duration": 1, "chance": 0.5})
+    path = tmp_path / "spells.json"
+    path.write_text(json.dumps(spells), encoding="utf-8")
+    script = (
+        "import numpy as np, magebotcli\n"
+        "from test_magebot import random_states\n"
+        "for depth in (1, 2):\n"
+        "    states = random_states(depth, count=200)\n"
+        "    scores = magebotcli.batch_minimax(np.array(states, dtype=np.int16), depth)\n"
+        "    assert [float(score) for score in scores] == [magebotcli.minimax(state, depth) for state in states]\n"
+    )
+    env = dict(os.environ, MAGEBOT_SPELLS=str(path))
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+# ---- Spell file ----
+@pytest.mark.parametrize("key, value", [("damage", -1), ("damage", True), ("mana_cost", "3"), ("mana_cost", -5),
+                                        ("chance", 7), ("duration", -1)])
+def test_load_spells_rejects_invalid_values(tmp_path, key, value):
+    with open(magebotcli.SPELLS_PATH, encoding="utf-8") as f:
+        spells = json.load(f)
+    attack = next(entry for entry in spells["spells"] if entry["kind"] == "attack")
+    attack[key] = value
+    path = tmp_path / "spells.json"
+    path.write_text(json.dumps(spells), encoding="utf-8")
+    with pytest.raises(ValueError):
+        magebotcli.load_spells(str(path))
+
+def test_spell_views_keep_the_file_order():
+    with open(magebotcli.SPELLS_PATH, encoding="utf-8") as f:
+        names = [entry["name"] for entry in json.load(f)["spells"]]
+    assert list(magebotcli.all_spells) == names
+    assert magebotcli.spell_costs == sorted(magebotcli.spell_costs)
+
+
+# ---- Transposition table ----
+def test_transposition_table_evicts_the_least_recently_used_entry():
+    table = magebotcli.TranspositionTable(max_entries=3)
+    for key in "abc":
+        table.store(key, 1.0)
+    assert table.probe("a") == (1.0, magebotcli.TT_EXACT)  # "b" is now the least recently used
+    table.store("c", 2.0, magebotcli.TT_LOWER)  # overwriting refreshes "c" without evicting
+    table.store("d", 3.0)
+    assert list(table.entries) == ["a", "c", "d"]
+    assert table.probe("c") == (2.0, magebotcli.TT_LOWER)
+    assert table.probe("b") is None
+    assert (table.hits, table.misses, table.evictions) == (2, 1, 1)
+    assert table.stats()["hit_rate"] == pytest.approx(2 / 3)
+    table.clear()
+    assert len(table) == 0 and (table.hits, table.misses, table.evictions) == (0, 0, 0)
+
+def test_transposition_table_stays_within_max_entries():
+    table = magebotcli.TranspositionTable(max_entries=50)
+    for state in random_states(90, count=20):
+        assert magebotcli.alphabeta(state, 3, -float('inf'), float('inf'), table) == minimax(state, 3)
+        assert len(table) <= 50
+    assert table.evictions > 0
+    assert table.hits + table.misses > 0
+    disabled = magebotcli.TranspositionTable(max_entries=0)
+    disabled.store("a", 1.0)
+    assert disabled.probe("a") is None and len(disabled) == 0
+
+
+# ---- Alpha-beta ----
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_alphabeta_scores_match_minimax(depth):
+    for state in random_states(20 + depth):
+        assert magebotcli.alphabeta(state, depth, -float('inf'), float('inf')) == minimax(state, depth)
+        table = magebotcli.TranspositionTable()
+        assert magebotcli.alphabeta(state, depth, -float('inf'), float('inf'), table) == minimax(state, depth)
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_iterative_deepening_chooses_like_minimax(depth):
+    for state in random_states(30 + depth, turn=MAGEBOT):
+        candidates = magebotcli._candidate_spells(state)
+        if not candidates:
+            continue  # MageBot passes, no search
+        spell, score, searched_depth = magebotcli.iterative_deepening_search(state, time_budget=None, max_depth=depth,
+                                                                              table=magebotcli.TranspositionTable())
+        scores = [minimax(magebotcli.end_turn(magebotcli.apply_spell(state, magebotcli.spell_ids[name])), depth)
+                  for name in candidates]
+        assert searched_depth == depth
+        assert score == max(scores)
+        assert spell == candidates[scores.index(score)]
+
+
+# ---- Expectimax ----
+# Unpruned expectimax: every chance node is the probability-weighted sum of all its outcomes
+def reference_expectimax(state, depth):
+    if state[magebotcli.HP] <= 0:
+        return magebotcli.SCORE_MAX
+    if state[magebotcli.SIDE_SIZE + magebotcli.HP] <= 0:
+        return magebotcli.SCORE_MIN
+    if depth == 0:
+        return max(magebotcli.SCORE_MIN, min(magebotcli.SCORE_MAX, magebotcli.evaluate_state(state)))
+    values = [reference_chance(outcomes, depth - 1) for _, outcomes in magebotcli.expand_turn_outcomes(state)]
+    return max(values) if state[magebotcli.TURN] == MAGEBOT else min(values)
+
+def reference_chance(outcomes, depth):
+    return sum(probability * reference_expectimax(child, depth) for probability, child in outcomes)
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_expectimax_scores_match_reference(depth):
+    for state in random_states(40 + depth, count=50):
+        expected = reference_expectimax(state, depth)
+        assert magebotcli.ExpectimaxSearch().value(state, depth) == pytest.approx(expected)
+        assert magebotcli.ExpectimaxSearch(magebotcli.TranspositionTable()).value(state, depth) == pytest.approx(expected)
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_expectimax_search_chooses_like_reference(depth):
+    for state in random_states(50 + depth, count=50, turn=MAGEBOT):
+        candidates = magebotcli._candidate_spells(state)
+        if not candidates:
+            continue  # MageBot passes, no search
+        spell, score, searched_depth = magebotcli.expectimax_search(state, depth=depth, node_budget=None,
+                                                                    table=magebotcli.TranspositionTable())
+        scores = {name: reference_chance(magebotcli.spell_outcomes(state, magebotcli.spell_ids[name]), depth) for name in candidates}
+        assert searched_depth == depth
+        assert score == pytest.approx(max(scores.values()))
+        assert scores[spell] == pytest.approx(score)
+
+# One table shared by many searches, as in a duel: every stored score must be right for its flag
+def test_expectimax_table_entries_hold_across_searches():
+    table = magebotcli.TranspositionTable()
+    for depth in (1, 2, 3):
+        for state in random_states(60 + depth, count=60, turn=MAGEBOT):
+            if magebotcli._candidate_spells(state):
+                magebotcli.expectimax_search(state, depth=depth, node_budget=None, table=table)
+    for (state, depth, *_), (score, flag) in table.entries.items():
+        expected = reference_expectimax(state, depth)
+        if flag == magebotcli.TT_EXACT:
+            assert score == pytest.approx(expected)
+        elif flag == magebotcli.TT_LOWER:
+            assert expected >= score - 1e-9
+        else:
+            assert expected <= score + 1e-9
+    for state in random_states(70, count=60):
+        assert magebotcli.ExpectimaxSearch(table).value(state, 2) == pytest.approx(reference_expectimax(state, 2))
+
+# Decisions under other weights neither read nor fill the shared table
+@pytest.mark.parametrize("engine", ["alphabeta", "expectimax"])
+def test_custom_weights_keep_off_the_shared_table(engine):
+    weights = (1.0, 0.1, 2.0, 3.0, 1.5, 0.5)
+    table = magebotcli.transposition_table
+    table.clear()
+    for state in random_states(80, count=20, turn=MAGEBOT):
+        expected = magebotcli.magebot_choose_spell(state, table=magebotcli.TranspositionTable(), depth=2, engine=engine, weights=weights)
+        assert magebotcli.magebot_choose_spell(state, depth=2, engine=engine, weights=weights) == expected
+    assert len(table.entries) == 0 and table.hits == table.misses == 0
+
+
+# ---- Monte Carlo Tree Search ----
+def test_mcts_passes_without_an_affordable_spell():
+    state = DuelState(10, 0, 15, 0, 0, 0, 10, 0, 0, 0, 0, 0, MAGEBOT)
+    assert magebotcli.mcts_search(state, tree=magebotcli.MctsTree(), seed=1) == (None, 0.5, 0)
+    assert magebotcli.magebot_choose_spell(state, engine="mcts") is None
+
+# Anytime: an expired budget still tries every candidate once, no budget runs every iteration
+def test_mcts_stops_on_its_budget():
+    state = DuelState(10, 2, 8, 0, 0, 0, 10, 2, 8, 0, 0, 0, MAGEBOT)
+    candidates = magebotcli._candidate_spells(state)
+    tree = magebotcli.MctsTree()
+    spell, _, _ = magebotcli.mcts_search(state, iterations=10 ** 9, time_budget=0, workers=1, tree=tree, seed=1)
+    assert spell in candidates
+    assert tree.root.n == len(candidates)
+    assert all(tree.root.visits[index] == 1 for index, (spell_id, _) in enumerate(tree.root.moves)
+               if magebotcli.spell_names[spell_id] in candidates)
+    tree = magebotcli.MctsTree()
+    magebotcli.mcts_search(state, iterations=300, workers=1, tree=tree, seed=1)
+    assert tree.root.n == 300
+
+# The next decision starts from the node two plies below the previous root, with its visits
+def test_mcts_tree_reuses_the_reached_subtree():
+    state = DuelState(10, 2, 8, 0, 0, 0, 10, 2, 8, 0, 0, 0, MAGEBOT)
+    tree = magebotcli.MctsTree()
+    magebotcli.mcts_search(state, iterations=2000, workers=1, tree=tree, seed=2)
+    grandchild = max((grandchild for child in tree.root.children.values() for grandchild in child.children.values()
+                      if grandchild.moves and grandchild.reward is None), key=lambda node: node.n)
+    assert grandchild.n > 0
+    position = magebotcli.begin_turn(grandchild.state)
+    assert tree.advance(position) is grandchild
+    assert tree.reused == grandchild.n
+    visits = grandchild.n
+    magebotcli.mcts_search(position, iterations=100, workers=1, tree=tree, seed=3)
+    assert tree.root is grandchild and grandchild.n == visits + 100
+    # A position the tree never reached starts a fresh tree
+    assert tree.advance(state._replace(magebot_hp=1)) is not grandchild
+    assert tree.reused == 0 and tree.root.n == 0
+
+
+# ---- Pondering ----
+class RecordList:
+    def __init__(self):
+        self.records = []
+
+    def record(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+# MageBot's position after the player casts `name` (an effect-free spell) in `state`
+def magebot_position(state, name):
+    return magebotcli.begin_turn(magebotcli.end_turn(magebotcli.apply_spell(state, magebotcli.spell_ids[name])))
+
+def test_ponderer_answers_a_pondered_position():
+    state = magebotcli.new_duel_state()
+    position = magebot_position(state, next(iter(magebotcli.resistance_spells)))
+    possible_spells = [magebotcli.spell_names[spell_id] for spell_id in magebotcli.affordable_spell_ids(position)]
+    expected = magebotcli.magebot_choose_spell(position, possible_spells, table=None, engine="minimax")
+    sink = RecordList()
+    magebotcli.enable_search_monitor(sink)
+    ponderer = magebotcli.Ponderer(engine="minimax", time_budget=None)
+    try:
+        ponderer.start(state)
+        assert position in ponderer.futures
+        assert ponderer.choose(position, possible_spells) == expected
+    finally:
+        ponderer.close()
+        magebotcli.disable_search_monitor()
+    assert (ponderer.hits, ponderer.misses) == (1, 0)
+    assert not ponderer.futures
+    assert sink.records[-1]["ponder_hit"] is True and sink.records[-1]["nodes"] == 0
+    assert all(record["ponder"] for record in sink.records[:-1])
+
+def test_ponderer_searches_an_unexpected_position():
+    state = magebotcli.new_duel_state()
+    position = state._replace(magebot_hp=state.magebot_hp - 7, turn=MAGEBOT)  # no spell deals 7 damage
+    possible_spells = [magebotcli.spell_names[spell_id] for spell_id in magebotcli.affordable_spell_ids(position)]
+    ponderer = magebotcli.Ponderer(engine="minimax", time_budget=None)
+    try:
+        ponderer.start(state)
+        assert position not in ponderer.futures
+        assert ponderer.choose(position, possible_spells) == magebotcli.magebot_choose_spell(position, possible_spells, table=None,
+                                                                                             engine="minimax")
+    finally:
+        ponderer.close()
+    assert (ponderer.hits, ponderer.misses) == (0, 1)
+    assert not ponderer.futures
+
+def test_ponderer_cancel_drops_every_search():
+    state = magebotcli.new_duel_state()
+    ponderer = magebotcli.Ponderer(engine="minimax", time_budget=None)
+    try:
+        ponderer.start(state)
+        futures = list(ponderer.futures.values())
+        position = next(iter(ponderer.futures))
+        ponderer.cancel()
+        assert not ponderer.futures
+        assert ponderer.result(position) is None
+        magebotcli.wait_futures(futures)
+    finally:
+        ponderer.close()
+    assert (ponderer.hits, ponderer.misses) == (0, 1)
+    assert all(future.done() for future in futures)
+
+
+# ---- Replay files ----
+@pytest.mark.parametrize("record_format", ["binary", "jsonl"])
+def test_recorded_games_replay_exactly(tmp_path, record_format):
+    play_chunk("greedy", "minimax", 1, 0, 6, record=str(tmp_path), record_format=record_format)
+    play_chunk("random", "random", 2, 0, 6, max_turns=8, record=str(tmp_path), record_format=record_format)  # undecided duels
+    paths = sorted(tmp_path.iterdir())
+    assert len(paths) == 12
+    for path in paths:
+        ok, message = replay(str(path), quiet=True)
+        assert ok, f"{path.name}: {message}"
+
+# Without a replay file the simulator counts its statistics in its own loop: it must play the same games
+@pytest.mark.parametrize("policies", [("random", "random"), ("greedy", "minimax")])
+def test_simulator_counts_like_the_duel_log(tmp_path, policies):
+    assert (play_chunk(*policies, 5, 0, 40, max_turns=30)
+            == play_chunk(*policies, 5, 0, 40, max_turns=30, record=str(tmp_path)))
+
+def test_binary_and_jsonl_replays_hold_the_same_duel(tmp_path):
+    for record_format in ("binary", "jsonl"):
+        play_chunk("greedy", "expectimax", 3, 0, 1, record=str(tmp_path), record_format=record_format)
+    assert magebotcli.read_replay(str(tmp_path / "game-3-0.mbr")) == magebotcli.read_replay(str(tmp_path / "game-3-0.jsonl"))
+
+def test_replay_reports_a_changed_event(tmp_path):
+    play_chunk("greedy", "minimax", 4, 0, 1, record=str(tmp_path), record_format="jsonl")
+    path = tmp_path / "game-4-0.jsonl"
+    lines = path.read_text(encoding="utf-8").splitlines()
+    index = next(index for index, line in enumerate(lines) if line.startswith('["damage"'))
+    event = json.loads(lines[index])
+    event[2] += 1
+    lines[index] = json.dumps(event)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    ok, message = replay(str(path), quiet=True)
+    assert not ok
+    assert message.startswith(f"diverges at event {index - 1} ")
+
+
+# ---- Endgame tablebase ----
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    magebottb = pytest.importorskip("magebottb")
+    path = magebotcli.TABLEBASE_PATH
+    if not magebottb.is_up_to_date(path):
+        path = str(tmp_path_factory.mktemp("tablebase") / "magebot.tb")
+        magebottb.ensure_tablebase(path, verbose=False)
+    table = magebotcli.Tablebase(path)
+    yield table
+    table.close()
+
+def test_tablebase_outcomes_are_consistent(tablebase):
+    rng = random.Random(5)
+    for _ in range(2000):
+        state = DuelState(rng.randint(1, MAX_HP), rng.randint(0, 6), rng.randint(0, MAX_MANA), 0, 0, 0,
+                          rng.randint(1, MAX_HP), rng.randint(0, 6), rng.randint(0, MAX_MANA), 0, 0, 0, rng.choice((PLAYER, MAGEBOT)))
+        outcome, best = tablebase.probe(state)
+        # None: the move kills the opponent (outside the table), otherwise the outcome for the opponent
+        children = {spell_id: tablebase.probe(child) for spell_id, child in magebotcli.expand_turn(state)}
+        child_outcomes = {spell_id: None if entry is None else entry[0] for spell_id, entry in children.items()}
+        assert best in child_outcomes
+        if outcome == magebotcli.TB_WIN:
+            assert child_outcomes[best] in (None, magebotcli.TB_LOSS)
+        elif outcome == magebotcli.TB_LOSS:
+            assert all(child == magebotcli.TB_WIN for child in child_outcomes.values())
+        else:
+            assert magebotcli.TB_LOSS not in child_outcomes.values() and None not in child_outcomes.values()
+            assert magebotcli.TB_DRAW in child_outcomes.values()